@@ -0,0 +1,12 @@
+import pytest
+
+
+@pytest.fixture(scope='session', autouse=True)
+def test_settings():
+    """Те же настройки тестов, что у manage.py test, см. core.testing."""
+    from core.testing import TestSettings
+
+    test_settings = TestSettings()
+    test_settings.enable()
+    yield
+    test_settings.disable()
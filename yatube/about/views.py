@@ -1,9 +1,9 @@
-from django.views.generic.base import TemplateView
+from core.prerender import StaticTemplateView
 
 
-class AboutAuthorView(TemplateView):
+class AboutAuthorView(StaticTemplateView):
     template_name = 'about/author.html'
 
 
-class AboutTechView(TemplateView):
+class AboutTechView(StaticTemplateView):
     template_name = 'about/tech.html'
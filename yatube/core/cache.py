@@ -0,0 +1,117 @@
+import math
+import random
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from core import routers
+
+VERSION_KEY = 'version:{}'
+LOCK_KEY = '{}:lock'
+# Сколько держится блокировка пересчёта и сколько её ждут остальные
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 2
+LOCK_POLL_INTERVAL = 0.05
+
+
+def _new_version():
+    # Номер от времени не совпадёт с номером вытесненного из кеша поколения
+    return int(time.time() * 1000)
+
+
+def get_versions(*names):
+    """Текущие номера поколений набора данных одной строкой.
+
+    Строка годится как часть ключа кеша: фрагмент, закешированный с ней,
+    живёт бессрочно и перестаёт находиться сразу после bump_versions()
+    любого из имён. При чтении с реплики в строку входит и метка её
+    снимка, см. core.routers.snapshot().
+    """
+    keys = [VERSION_KEY.format(name) for name in names]
+    versions = cache.get_many(keys)
+    missing = {
+        key: _new_version() for key in keys if key not in versions
+    }
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    numbers = '.'.join(str(versions[key]) for key in keys)
+    snapshot = routers.snapshot()
+    return f'{numbers}@{snapshot}' if snapshot else numbers
+
+
+def bump_versions(*names):
+    """Начинает новое поколение для каждого из имён."""
+    for name in names:
+        key = VERSION_KEY.format(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), None)
+
+
+def bump_versions_on_commit(*names, using=None):
+    """bump_versions() после COMMIT текущей транзакции базы using.
+
+    Читатель, пришедший между сменой поколения и COMMIT, ещё видит
+    старые данные и закешировал бы их под новым номером бессрочно.
+    Вне транзакции поколения меняются сразу.
+    """
+    transaction.on_commit(lambda: bump_versions(*names), using=using)
+
+
+def _store(backend, key, value, timeout, stale_timeout, delta):
+    expires = None if timeout is None else time.time() + timeout
+    backend.set(
+        key,
+        (value, expires, delta),
+        None if timeout is None else timeout + stale_timeout,
+    )
+
+
+def _compute(backend, key, compute, timeout, stale_timeout):
+    started = time.time()
+    value = compute()
+    _store(
+        backend, key, value, timeout, stale_timeout, time.time() - started
+    )
+    return value
+
+
+def get_or_compute(key, compute, timeout=None, stale_timeout=60, beta=1.0,
+                   backend=cache):
+    """Значение из кеша; пересчитывает его только один процесс.
+
+    Пока один процесс под блокировкой пересчитывает устаревшее значение,
+    остальные отдают старое (stale-while-revalidate) ещё stale_timeout
+    секунд. Ближе к концу timeout значение с растущей вероятностью
+    пересчитывается заранее, пропорционально времени прошлого пересчёта,
+    чтобы ключи не истекали у всех процессов одновременно. Если значения
+    нет совсем, остальные процессы недолго ждут результата первого.
+    """
+    lock_key = LOCK_KEY.format(key)
+    entry = backend.get(key)
+    if entry is not None:
+        value, expires, delta = entry
+        if expires is None:
+            return value
+        # Вероятностный досрочный пересчёт (XFetch)
+        early = delta * beta * -math.log(1 - random.random())
+        if time.time() + early < expires:
+            return value
+        if not backend.add(lock_key, True, LOCK_TIMEOUT):
+            return value
+    elif not backend.add(lock_key, True, LOCK_TIMEOUT):
+        deadline = time.time() + LOCK_WAIT
+        while time.time() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            entry = backend.get(key)
+            if entry is not None:
+                return entry[0]
+        # Не дождались: считаем сами, но без блокировки
+        return _compute(backend, key, compute, timeout, stale_timeout)
+    try:
+        return _compute(backend, key, compute, timeout, stale_timeout)
+    finally:
+        backend.delete(lock_key)
@@ -0,0 +1,214 @@
+"""Общий для всех процессов хоста кеш в файле SQLite (режим WAL)."""
+import itertools
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from core import timing
+
+# Целые числа храним как есть, чтобы incr() был одним UPDATE
+INT_MIN, INT_MAX = -2 ** 63, 2 ** 63 - 1
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY,'
+    ' value BLOB NOT NULL,'
+    ' expires REAL,'
+    ' accessed REAL NOT NULL'
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)',
+)
+
+
+class SQLiteCache(BaseCache):
+    """Кеш, который видят все воркеры хоста, без сетевого сервера.
+
+    Записи вытесняются по LRU при превышении MAX_ENTRIES, у каждой есть
+    срок жизни, incr() атомарен между процессами. Размер таблицы
+    проверяется на каждой CULL_FREQUENCY-й записи, поэтому он может
+    ненадолго превысить MAX_ENTRIES на несколько записей.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        options = params.get('OPTIONS', {})
+        self._busy_timeout = options.get('BUSY_TIMEOUT', 5)
+        # Время последнего чтения обновляется не чаще раза в секунду
+        self._touch_interval = options.get('ACCESS_RESOLUTION', 1)
+        self._local = threading.local()
+        # COUNT(*) обходит всю таблицу: считаем не на каждой записи
+        self._writes = itertools.count(1)
+
+    @property
+    def _db(self):
+        # Соединение своё у каждого потока и каждого процесса после fork
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            db = sqlite3.connect(
+                self._path,
+                timeout=self._busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                db.execute(statement)
+            local.db, local.pid = db, os.getpid()
+        return local.db
+
+    @staticmethod
+    def _dump(value):
+        if type(value) is int and INT_MIN <= value <= INT_MAX:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _load(value):
+        return value if type(value) is int else pickle.loads(value)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def get(self, key, default=None, version=None):
+        started = time.perf_counter()
+        value = self._get(self._key(key, version), default)
+        timing.record(
+            'cache_miss' if value is default else 'cache_hit',
+            time.perf_counter() - started,
+        )
+        return value
+
+    def _get(self, key, default):
+        now = time.time()
+        row = self._db.execute(
+            'SELECT value, expires, accessed FROM cache WHERE key = ?',
+            (key,),
+        ).fetchone()
+        if row is None:
+            return default
+        value, expires, accessed = row
+        if expires is not None and expires <= now:
+            self._db.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, now),
+            )
+            return default
+        if now - accessed > self._touch_interval:
+            self._db.execute(
+                'UPDATE cache SET accessed = ? WHERE key = ?', (now, key)
+            )
+        return self._load(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        self._db.execute(
+            'INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)',
+            (key, self._dump(value), self.get_backend_timeout(timeout),
+             time.time()),
+        )
+        self._cull()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, now),
+            )
+            added = db.execute(
+                'INSERT OR IGNORE INTO cache VALUES (?, ?, ?, ?)',
+                (key, self._dump(value), self.get_backend_timeout(timeout),
+                 now),
+            ).rowcount == 1
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        if added:
+            self._cull()
+        return added
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute(
+                'UPDATE cache SET value = value + ? '
+                'WHERE key = ? AND typeof(value) = \'integer\' '
+                'AND (expires IS NULL OR expires > ?)',
+                (delta, key, time.time()),
+            )
+            row = db.execute(
+                'SELECT value FROM cache WHERE key = ? AND changes() = 1',
+                (key,),
+            ).fetchone()
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        if row is None:
+            raise ValueError(f"Key '{key}' not found")
+        return row[0]
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        return self._db.execute(
+            'UPDATE cache SET expires = ?, accessed = ? '
+            'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), now, key, now),
+        ).rowcount == 1
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return self._db.execute(
+            'SELECT 1 FROM cache '
+            'WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (key, time.time()),
+        ).fetchone() is not None
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        self._db.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+
+    def _cull(self):
+        if next(self._writes) % max(self._cull_frequency, 1):
+            return
+        db = self._db
+        count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        db.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            db.execute('DELETE FROM cache')
+            return
+        # Вытесняем давно не читанные записи
+        db.execute(
+            'DELETE FROM cache WHERE key IN ('
+            ' SELECT key FROM cache ORDER BY accessed LIMIT ?'
+            ')',
+            (count // self._cull_frequency,),
+        )
+
+    def close(self, **kwargs):
+        # Соединение переиспользуется между запросами
+        pass
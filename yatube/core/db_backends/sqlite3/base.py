@@ -0,0 +1,55 @@
+"""SQLite для рабочего сервера: WAL, настроенные PRAGMA и ожидание блокировок.
+
+В режиме WAL читатели не ждут писателя и наоборот; запись одна за раз.
+Транзакции открываются как BEGIN IMMEDIATE: блокировка записи берётся
+сразу, и конкурирующий писатель ждёт её busy_timeout миллисекунд, а не
+получает «database is locked», когда пытается поднять блокировку чтения
+до записи посреди транзакции.
+
+PRAGMA задаются в OPTIONS['pragmas'] поверх PRAGMAS.
+"""
+from django.db.backends.sqlite3 import base
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    # В режиме WAL NORMAL не теряет целостность, только последние
+    # транзакции при отключении питания
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    # Отрицательное значение — в килобайтах: 64 МБ страниц на соединение
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+def configure(connection, pragmas=None):
+    """Выставляет соединению sqlite3 PRAGMAS и pragmas поверх них."""
+    for name, value in {**PRAGMAS, **(pragmas or {})}.items():
+        connection.execute(f'PRAGMA {name} = {value}')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.pragmas = kwargs.pop('pragmas', {})
+        self.transaction_mode = kwargs.pop('transaction_mode', 'IMMEDIATE')
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        configure(connection, self.pragmas)
+        return connection
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute(f'BEGIN {self.transaction_mode}')
+
+    def _close(self):
+        if self.connection is not None:
+            # Статистика для планировщика по тому, что соединение успело
+            # прочитать; обычно это не стоит ничего
+            try:
+                self.connection.execute('PRAGMA optimize')
+            except base.Database.Error:
+                pass
+        super()._close()
@@ -0,0 +1,28 @@
+from functools import wraps
+
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+
+def anonymous_condition(etag_func=None, last_modified_func=None):
+    """Условный GET для анонимов: 304 без выборок и отрисовки шаблона.
+
+    Анонимные ответы помечаются как общие, чтобы их мог хранить обратный
+    прокси и переспрашивать по ETag/Last-Modified. Ответы пользователям
+    с сессией остаются приватными.
+    """
+    def decorator(view):
+        conditional_view = condition(etag_func, last_modified_func)(view)
+
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            if request.user.is_authenticated:
+                response = view(request, *args, **kwargs)
+                patch_cache_control(response, private=True)
+            else:
+                response = conditional_view(request, *args, **kwargs)
+                patch_cache_control(response, public=True, no_cache=True)
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return inner
+    return decorator
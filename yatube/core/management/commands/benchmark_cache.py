@@ -0,0 +1,89 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from core.cache import get_or_compute
+from core.cache_backends.sqlite import SQLiteCache
+
+RENDER_TIME = 0.05
+
+
+def _render_page(backend, renders):
+    def compute():
+        with renders.get_lock():
+            renders.value += 1
+        time.sleep(RENDER_TIME)
+        return 'x' * 20000
+    get_or_compute('index_page', compute, 60, backend=backend)
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает SQLiteCache и LocMemCache: операции в секунду '
+        'и число отрисовок одной страницы несколькими воркерами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ops', type=int, default=20000)
+        parser.add_argument('--workers', type=int, default=4)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cache.sqlite3')
+            backends = {
+                'locmem': lambda: LocMemCache('benchmark', {
+                    'OPTIONS': {'MAX_ENTRIES': options['ops']},
+                }),
+                'sqlite': lambda: SQLiteCache(path, {
+                    'OPTIONS': {'MAX_ENTRIES': options['ops']},
+                }),
+            }
+            self.stdout.write(
+                f'{"backend":<8} {"set/s":>10} {"get/s":>10} '
+                f'{"incr/s":>10} {"renders":>8}'
+            )
+            for name, factory in backends.items():
+                backend = factory()
+                backend.clear()
+                rates = self.operations(backend, options['ops'])
+                renders = self.renders(factory, options['workers'])
+                self.stdout.write(
+                    f'{name:<8} {rates[0]:>10.0f} {rates[1]:>10.0f} '
+                    f'{rates[2]:>10.0f} {renders:>8}'
+                )
+
+    @staticmethod
+    def operations(backend, ops):
+        keys = [f'key{i}' for i in range(ops)]
+        value = {'text': 'x' * 200}
+        rates = []
+        for operation in (
+            lambda key: backend.set(key, value),
+            backend.get,
+            lambda key: backend.incr('counter'),
+        ):
+            backend.set('counter', 0)
+            started = time.perf_counter()
+            for key in keys:
+                operation(key)
+            rates.append(ops / (time.perf_counter() - started))
+        return rates
+
+    @staticmethod
+    def renders(factory, workers):
+        """Сколько раз воркеры отрисовали одну и ту же холодную страницу."""
+        context = multiprocessing.get_context('fork')
+        renders = context.Value('i', 0)
+        processes = [
+            context.Process(target=_render_page, args=(factory(), renders))
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        return renders.value
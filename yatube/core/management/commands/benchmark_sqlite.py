@@ -0,0 +1,136 @@
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.db_backends.sqlite3.base import configure
+
+MODES = (
+    # имя, PRAGMA поверх PRAGMAS бэкенда (None — настройки SQLite по
+    # умолчанию, как у стандартного бэкенда), соединение живёт весь прогон
+    ('rollback', None, False),
+    ('wal', {}, False),
+    ('wal+persistent', {}, True),
+)
+
+SCHEMA = (
+    'CREATE TABLE post ('
+    ' id INTEGER PRIMARY KEY, pub_date REAL NOT NULL, text TEXT NOT NULL)',
+    'CREATE INDEX post_date ON post (pub_date, id)',
+)
+READ = (
+    'SELECT id, text FROM post WHERE pub_date < ? '
+    'ORDER BY pub_date DESC, id DESC LIMIT 10'
+)
+
+
+def _connect(path, pragmas):
+    connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+    if pragmas is not None:
+        configure(connection, pragmas)
+    return connection
+
+
+def _worker(path, pragmas, persistent, write, deadline, done, errors):
+    rng = random.Random(os.getpid())
+    connection = _connect(path, pragmas) if persistent else None
+    while time.time() < deadline:
+        db = connection or _connect(path, pragmas)
+        try:
+            if write:
+                db.execute('BEGIN IMMEDIATE')
+                db.execute(
+                    'INSERT INTO post (pub_date, text) VALUES (?, ?)',
+                    (time.time(), 'x' * 500),
+                )
+                db.execute('COMMIT')
+            else:
+                db.execute(
+                    READ, (time.time() - rng.random() * 1000,)
+                ).fetchall()
+            with done.get_lock():
+                done.value += 1
+        except sqlite3.OperationalError:
+            if db.in_transaction:
+                db.execute('ROLLBACK')
+            with errors.get_lock():
+                errors.value += 1
+        finally:
+            if db is not connection:
+                db.close()
+
+
+class Command(BaseCommand):
+    help = (
+        'Чтения и записи в секунду при одновременной работе нескольких '
+        'читающих и пишущих процессов: журнал отката против WAL с '
+        'настройками core.db_backends.sqlite3, с постоянным соединением '
+        'и без.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--writers', type=int, default=1)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--rows', type=int, default=50000)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f'{"mode":<16} {"reads/s":>10} {"writes/s":>10} '
+            f'{"read err":>9} {"write err":>9}'
+        )
+        for name, pragmas, persistent in MODES:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'db.sqlite3')
+                self.fill(path, pragmas, options['rows'])
+                done, errors = self.run(path, pragmas, persistent, options)
+                self.stdout.write(
+                    f'{name:<16} {done[0] / options["seconds"]:>10.0f} '
+                    f'{done[1] / options["seconds"]:>10.0f} '
+                    f'{errors[0]:>9} {errors[1]:>9}'
+                )
+
+    @staticmethod
+    def fill(path, pragmas, rows):
+        connection = _connect(path, pragmas)
+        for statement in SCHEMA:
+            connection.execute(statement)
+        now = time.time()
+        connection.execute('BEGIN')
+        connection.executemany(
+            'INSERT INTO post (pub_date, text) VALUES (?, ?)',
+            ((now - i * 0.02, 'x' * 500) for i in range(rows)),
+        )
+        connection.execute('COMMIT')
+        connection.close()
+
+    @staticmethod
+    def run(path, pragmas, persistent, options):
+        """Число выполненных операций и ошибок: (чтения, записи)."""
+        context = multiprocessing.get_context('fork')
+        deadline = time.time() + options['seconds']
+        counters = {
+            write: (context.Value('i', 0), context.Value('i', 0))
+            for write in (False, True)
+        }
+        processes = [
+            context.Process(target=_worker, args=(
+                path, pragmas, persistent, write, deadline, *counters[write]
+            ))
+            for write, count in (
+                (False, options['readers']), (True, options['writers'])
+            )
+            for _ in range(count)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        return (
+            (counters[False][0].value, counters[True][0].value),
+            (counters[False][1].value, counters[True][1].value),
+        )
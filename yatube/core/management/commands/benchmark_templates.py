@@ -0,0 +1,81 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.template import RequestContext
+from django.template.backends.django import DjangoTemplates
+from django.test import RequestFactory
+
+from core import prerender
+
+# Страницы, которые анонимам отдаются готовыми, см. core.prerender
+STATIC_TEMPLATES = (
+    'about/author.html',
+    'about/tech.html',
+    'core/403csrf.html',
+    'core/500.html',
+)
+
+
+def engine(loaders):
+    """Движок с настройками проекта и заданными загрузчиками."""
+    params = settings.TEMPLATES[0]
+    return DjangoTemplates({
+        'NAME': 'benchmark',
+        'DIRS': params['DIRS'],
+        'APP_DIRS': False,
+        'OPTIONS': {**params['OPTIONS'], 'loaders': loaders},
+    }).engine
+
+
+class Command(BaseCommand):
+    help = (
+        'Время отрисовки шаблона анониму, мкс: с разбором шаблона на '
+        'каждый запрос, из кеширующего загрузчика и готовыми байтами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'templates', nargs='*',
+            default=(*STATIC_TEMPLATES, 'core/404.html'),
+        )
+        parser.add_argument('--repeat', type=int, default=500)
+
+    def handle(self, *args, **options):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        request.resolver_match = None
+        plain = engine(settings.TEMPLATE_LOADERS)
+        cached = engine([
+            ('django.template.loaders.cached.Loader',
+             settings.TEMPLATE_LOADERS),
+        ])
+        repeat = options['repeat']
+
+        def measure(render):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                render()
+            return (time.perf_counter() - started) / repeat * 1e6
+
+        self.stdout.write(
+            f'{"template":<20} {"parse":>10} {"cached":>10} '
+            f'{"prerender":>10}'
+        )
+        prerender.clear()
+        for name in options['templates']:
+            parsed = measure(lambda: plain.get_template(name).render(
+                RequestContext(request)
+            ))
+            loaded = measure(lambda: cached.get_template(name).render(
+                RequestContext(request)
+            ))
+            ready = '-'
+            if name in STATIC_TEMPLATES:
+                ready = '{:.1f}'.format(measure(
+                    lambda: prerender.render_static(request, name)
+                ))
+            self.stdout.write(
+                f'{name:<20} {parsed:>10.0f} {loaded:>10.0f} {ready:>10}'
+            )
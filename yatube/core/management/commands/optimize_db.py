@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Обслуживание базы SQLite: обновляет статистику планировщика '
+        '(PRAGMA optimize или полный ANALYZE) и сбрасывает журнал WAL в '
+        'файл базы. Запускается по расписанию, например из cron раз в '
+        'час, или сама повторяется с --interval.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='Полный ANALYZE вместо PRAGMA optimize.',
+        )
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Повторять каждые N секунд, пока процесс не остановят.',
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor != 'sqlite':
+            raise CommandError('Команда обслуживает только SQLite')
+        while True:
+            self.run(connection, options['analyze'])
+            if not options['interval']:
+                return
+            # Соединение не держим открытым между запусками
+            connection.close()
+            time.sleep(options['interval'])
+
+    def run(self, connection, analyze):
+        steps = (
+            ('ANALYZE' if analyze else 'PRAGMA optimize'),
+            # Журнал WAL растёт, пока его не перенесут в базу целиком
+            'PRAGMA wal_checkpoint(TRUNCATE)',
+        )
+        with connection.cursor() as cursor:
+            for statement in steps:
+                started = time.perf_counter()
+                cursor.execute(statement)
+                cursor.fetchall()
+                self.stdout.write(
+                    f'{statement}: '
+                    f'{(time.perf_counter() - started) * 1000:.1f} мс'
+                )
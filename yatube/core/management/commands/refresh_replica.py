@@ -0,0 +1,65 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        'Снимает копию основной базы SQLite в реплики через backup API. '
+        'Писатели основной базы в режиме WAL копии не ждут; чтения '
+        'реплики ждут конца копирования. Запускается по расписанию или '
+        'сама повторяется с --interval, который должен быть меньше '
+        'REPLICA_STICKY_SECONDS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'aliases', nargs='*',
+            help='Реплики; по умолчанию все из DATABASE_REPLICAS.',
+        )
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Повторять каждые N секунд, пока процесс не остановят.',
+        )
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or settings.DATABASE_REPLICAS
+        databases = [connections[DEFAULT_DB_ALIAS], *map(
+            connections.__getitem__, aliases
+        )]
+        if any(
+            connection.vendor != 'sqlite' or connection.is_in_memory_db()
+            for connection in databases
+        ):
+            raise CommandError('Копируются только файлы баз SQLite')
+        source, *replicas = (
+            connection.settings_dict['NAME'] for connection in databases
+        )
+        while True:
+            for alias, replica in zip(aliases, replicas):
+                started = time.perf_counter()
+                self.copy(source, replica)
+                self.stdout.write(
+                    f'{alias}: '
+                    f'{(time.perf_counter() - started) * 1000:.0f} мс'
+                )
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+
+    @staticmethod
+    def copy(source, replica):
+        source = sqlite3.connect(source)
+        replica = sqlite3.connect(replica, timeout=30)
+        try:
+            # Одним шагом: по частям копия начиналась бы заново после
+            # каждой записи в основную базу
+            source.backup(replica)
+            # Реплика остаётся в режиме журнала отката, см. settings
+            replica.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            replica.close()
+            source.close()
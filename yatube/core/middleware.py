@@ -0,0 +1,127 @@
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import routers, timing
+
+logger = logging.getLogger(__name__)
+
+
+class PerformanceMiddleware:
+    """Время SQL, шаблонов, кеша и миниатюр в заголовке Server-Timing.
+
+    Те же цифры с именем представления пишутся в журнал JSON-строкой для
+    доли запросов PERFORMANCE_LOG_SAMPLE_RATE и для всех запросов дольше
+    PERFORMANCE_SLOW_REQUEST секунд. Учёт стоит пары вызовов функции на
+    SQL-запрос и обращение к кешу.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_timing, token = timing.start()
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(request_timing.sql)
+                    )
+                response = self.get_response(request)
+        finally:
+            timing.stop(token)
+        total = time.perf_counter() - started
+        metrics = self.metrics(request_timing, total)
+        response['Server-Timing'] = self.server_timing(metrics)
+        if (
+            total >= settings.PERFORMANCE_SLOW_REQUEST
+            or random.random() < settings.PERFORMANCE_LOG_SAMPLE_RATE
+        ):
+            self.log(request, response, metrics)
+        return response
+
+    @staticmethod
+    def metrics(request_timing, total):
+        durations = request_timing.durations
+        counts = request_timing.counts
+        hits = counts.get('cache_hit', 0)
+        misses = counts.get('cache_miss', 0)
+        return {
+            'total_ms': total * 1000,
+            'db_ms': durations.get('db', 0) * 1000,
+            'queries': counts.get('db', 0),
+            'template_ms': durations.get('template', 0) * 1000,
+            'cache_ms': (
+                durations.get('cache_hit', 0) + durations.get('cache_miss', 0)
+            ) * 1000,
+            'cache_hits': hits,
+            'cache_misses': misses,
+            'thumbnail_ms': durations.get('thumbnail', 0) * 1000,
+        }
+
+    @staticmethod
+    def server_timing(metrics):
+        return ', '.join((
+            f'db;dur={metrics["db_ms"]:.1f};'
+            f'desc="{metrics["queries"]} queries"',
+            f'template;dur={metrics["template_ms"]:.1f}',
+            f'cache;dur={metrics["cache_ms"]:.1f};'
+            f'desc="{metrics["cache_hits"]} hits / '
+            f'{metrics["cache_misses"]} misses"',
+            f'thumbnail;dur={metrics["thumbnail_ms"]:.1f}',
+            f'total;dur={metrics["total_ms"]:.1f}',
+        ))
+
+    @staticmethod
+    def log(request, response, metrics):
+        match = request.resolver_match
+        record = {
+            'view': match.view_name if match else None,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            **{
+                name: round(value, 2) if isinstance(value, float) else value
+                for name, value in metrics.items()
+            },
+        }
+        logger.info(
+            json.dumps(record, ensure_ascii=False),
+            extra={'performance': record},
+        )
+
+
+class ReplicaMiddleware:
+    """Отправляет чтения безопасных запросов на реплики, см. core.routers.
+
+    После записи ответ получает куку, которая REPLICA_STICKY_SECONDS
+    секунд держит чтения этого пользователя на основной базе.
+    """
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned = (
+            request.method not in self.safe_methods
+            or routers.STICKY_COOKIE in request.COOKIES
+        )
+        state, token = routers.start(pinned)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.stop(token)
+        if state.wrote:
+            response.set_cookie(
+                routers.STICKY_COOKIE, '1',
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 
 
 class CreatedModel(models.Model):
@@ -11,3 +12,67 @@ class CreatedModel(models.Model):
     class Meta:
         # Это абстрактная модель:
         abstract = True
+
+
+class StoredFileManager(models.Manager):
+    def acquire(self, name, count=1):
+        if not self.filter(name=name).update(refs=F('refs') + count):
+            self.bulk_create(
+                [self.model(name=name, refs=0)], ignore_conflicts=True
+            )
+            self.filter(name=name).update(refs=F('refs') + count)
+
+    def release(self, name):
+        """Снимает ссылку; True, если на файл больше никто не ссылается.
+
+        Запись с нулём ссылок остаётся до delete_unused(): на ней новая
+        ссылка на то же содержимое ждёт, пока файл удаляют.
+        """
+        self.filter(name=name, refs__gt=0).update(refs=F('refs') - 1)
+        return self.filter(name=name, refs=0).exists()
+
+    def delete_unused(self, name):
+        """Удаляет запись, если ссылок нет; True, если удалена."""
+        deleted, _ = self.filter(name=name, refs=0).delete()
+        return bool(deleted)
+
+
+class StoredFile(models.Model):
+    """Число ссылок на файл в core.storages.ContentAddressedStorage."""
+    name = models.CharField('Имя файла', max_length=255, primary_key=True)
+    refs = models.PositiveIntegerField('Число ссылок', default=0)
+
+    objects = StoredFileManager()
+
+    class Meta:
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
+
+    def __str__(self):
+        return f'{self.name}: {self.refs}'
+
+
+class SequenceManager(models.Manager):
+    def next_value(self, name, start=lambda: 0):
+        """Следующее значение счётчика; start() — начальное значение."""
+        with transaction.atomic(using=self.db):
+            if not self.filter(name=name).update(value=F('value') + 1):
+                self.create(name=name, value=start() + 1)
+            return self.filter(name=name).values_list(
+                'value', flat=True
+            ).get()
+
+
+class Sequence(models.Model):
+    """Общий для всех баз счётчик, например id постов на шардах."""
+    name = models.CharField('Имя', max_length=100, primary_key=True)
+    value = models.BigIntegerField('Значение', default=0)
+
+    objects = SequenceManager()
+
+    class Meta:
+        verbose_name = 'Последовательность'
+        verbose_name_plural = 'Последовательности'
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
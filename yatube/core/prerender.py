@@ -0,0 +1,50 @@
+"""Страницы, которые у всех анонимов одинаковы, отрисовываются один раз.
+
+Готовые байты хранятся в памяти процесса. От запроса в таких страницах
+зависят только имя представления (активный пункт меню) и год в подвале,
+поэтому они входят в ключ. Пользователям с сессией страница
+отрисовывается как обычно: в шапке их имя и личные ссылки.
+"""
+from django.http import HttpResponse
+from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils.cache import patch_vary_headers
+from django.views.generic.base import TemplateView
+
+from core.context_processors.year import year
+
+_pages = {}
+
+
+def render_static(request, template_name, status=200):
+    # Ошибка до AuthenticationMiddleware оставляет запрос без user:
+    # страница ошибки отдаётся как анониму
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        response = render(request, template_name, status=status)
+    else:
+        match = request.resolver_match
+        key = (
+            template_name,
+            match.view_name if match else None,
+            year(request)['year'],
+        )
+        content = _pages.get(key)
+        if content is None:
+            content = _pages[key] = render_to_string(
+                template_name, request=request
+            ).encode()
+        response = HttpResponse(content, status=status)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def clear():
+    _pages.clear()
+
+
+class StaticTemplateView(TemplateView):
+    """Страница без контекста, которую анонимам отдают готовой."""
+
+    def get(self, request, *args, **kwargs):
+        return render_static(request, self.template_name)
@@ -0,0 +1,113 @@
+"""Чтение с реплик, запись в основную базу.
+
+С реплик читают только безопасные запросы (GET, HEAD), которые
+ReplicaMiddleware отметил как подходящие. Команды, фоновые потоки,
+POST и транзакции работают с основной базой. Пользователь, который
+только что писал, ещё REPLICA_STICKY_SECONDS секунд читает из основной
+базы: реплика отстаёт до следующего refresh_replica, и без этого он не
+увидел бы свой комментарий.
+
+Поколения core.cache меняются при записи в основную базу, а реплика
+догоняет её только после refresh_replica. Поэтому к поколениям
+добавляется метка снимка реплики, см. snapshot(): всё закешированное по
+старому снимку перестаёт находиться, как только реплику обновят.
+"""
+import os
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Кука, которая держит чтения пользователя на основной базе
+STICKY_COOKIE = 'primary'
+
+_current = ContextVar('replica_reads', default=None)
+
+
+class ReplicaReads:
+    def __init__(self, pinned):
+        # pinned — читать из основной базы, wrote — в запросе была запись
+        self.pinned = pinned
+        self.wrote = False
+        # Реплика выбирается один раз, чтобы метка снимка совпадала с ней
+        self.replica = None
+
+
+def start(pinned):
+    state = ReplicaReads(pinned)
+    return state, _current.set(state)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+def available(alias):
+    """Годится ли реплика для чтения.
+
+    Подходят только копии SQLite от refresh_replica: у других баз нет
+    метки снимка. Копия, которую ещё ни разу не сняли, пропускается.
+    """
+    connection = connections[alias]
+    if connection.vendor != 'sqlite':
+        return False
+    if connection.is_in_memory_db():
+        return True
+    return os.path.exists(connection.settings_dict['NAME'])
+
+
+def generation(alias):
+    """Метка снимка реплики: время последней записи её файла.
+
+    Копия в памяти (зеркало основной базы в тестах) не отстаёт.
+    """
+    connection = connections[alias]
+    if connection.is_in_memory_db():
+        return ''
+    return str(os.stat(connection.settings_dict['NAME']).st_mtime_ns)
+
+
+def read_alias():
+    """База, из которой читает текущий контекст."""
+    state = _current.get()
+    if state is None or state.pinned:
+        return DEFAULT_DB_ALIAS
+    # Внутри транзакции читаем то, что в ней же и записали
+    if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return DEFAULT_DB_ALIAS
+    if state.replica is None:
+        replicas = [
+            alias for alias in settings.DATABASE_REPLICAS if available(alias)
+        ]
+        state.replica = (
+            random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+        )
+    return state.replica
+
+
+def snapshot():
+    """Метка снимка данных для ключей кеша; пусто для основной базы."""
+    alias = read_alias()
+    if alias == DEFAULT_DB_ALIAS:
+        return ''
+    return f'{alias}:{generation(alias)}'
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        state = _current.get()
+        if state is not None:
+            state.pinned = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Во всех базах одни и те же данные
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Реплики получают схему вместе с данными, см. refresh_replica
+        return db not in settings.DATABASE_REPLICAS
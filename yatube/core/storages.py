@@ -0,0 +1,91 @@
+"""Хранилище файлов с именами по содержимому.
+
+Файл сохраняется под именем из SHA-256 содержимого и раскладывается по
+вложенным каталогам по первым символам хеша: <каталог>/ab/cd/abcd...jpg.
+В одном каталоге оказывается немного файлов, а одинаковые загрузки
+хранятся один раз. Сколько записей ссылается на файл, хранит
+core.models.StoredFile; файл удаляется, когда ссылок не остаётся.
+Сохранение файла само берёт на него одну ссылку.
+"""
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.db import router, transaction
+from django.utils.deconstruct import deconstructible
+
+HASHED_NAME = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.\w+$')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    # Сколько уровней каталогов и сколько символов хеша на уровень
+    depth = 2
+    width = 2
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        directory, filename = os.path.split(name)
+        shards = [
+            digest[level * self.width:(level + 1) * self.width]
+            for level in range(self.depth)
+        ]
+        extension = os.path.splitext(filename)[1].lower()
+        return '/'.join(filter(None, (
+            directory, *shards, digest + extension
+        )))
+
+    @staticmethod
+    def is_hashed(name):
+        return bool(name and HASHED_NAME.search(name))
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        # Ссылка берётся до проверки: _delete_unused() удаляет файл под
+        # блокировкой записи о нём, так что после acquire() файл либо уже
+        # удалён и будет записан заново, либо останется
+        self.acquire(name)
+        self.store(name, content)
+        return name
+
+    def store(self, name, content):
+        """Кладёт content под именем по хешу, если файла ещё нет.
+
+        Ссылку не берёт: вызывающий отмечает её сам и после acquire()
+        проверяет, что файл не удалили раньше.
+        """
+        if self.exists(name):
+            # Такое содержимое уже лежит в хранилище
+            return
+        # Файл пишется под временным именем и атомарно ставится на место:
+        # недописанный файл никто не увидит, а одновременные загрузки
+        # одного содержимого просто заменят друг друга
+        temporary = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temporary), self.path(name))
+
+    def acquire(self, name, count=1):
+        """Отмечает, что на файл сослались ещё count раз."""
+        from core.models import StoredFile
+
+        if self.is_hashed(name):
+            StoredFile.objects.acquire(name, count)
+
+    def release(self, name):
+        """Снимает одну ссылку; файл без ссылок удаляется после коммита."""
+        from core.models import StoredFile
+
+        if self.is_hashed(name) and StoredFile.objects.release(name):
+            transaction.on_commit(lambda: self._delete_unused(name))
+
+    def _delete_unused(self, name):
+        from core.models import StoredFile
+
+        # Пока транзакция шла, на файл могли сослаться заново
+        with transaction.atomic(using=router.db_for_write(StoredFile)):
+            if StoredFile.objects.delete_unused(name):
+                self.delete(name)
@@ -0,0 +1,67 @@
+import logging
+import os
+
+from django.template import TemplateDoesNotExist, engines
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+from . import timing
+
+logger = logging.getLogger(__name__)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        with timing.measure('template'):
+            return super().render(context, request)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Шаблоны Django, время отрисовки которых попадает в Server-Timing.
+
+    Учитывается только внешний шаблон: include и extends отрисовываются
+    внутри него.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(
+                self.engine.get_template(template_name), self
+            )
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def template_names(engine):
+    """Имена всех шаблонов, которые видят загрузчики движка."""
+    names = set()
+    for loader in engine.template_loaders:
+        for inner in getattr(loader, 'loaders', [loader]):
+            for directory in inner.get_dirs():
+                for root, _, files in os.walk(directory):
+                    for file in files:
+                        path = os.path.join(root, file)
+                        names.add(os.path.relpath(path, directory))
+    return sorted(names)
+
+
+def precompile():
+    """Разбирает шаблоны заранее, чтобы их не разбирали первые запросы.
+
+    Имеет смысл только с кеширующим загрузчиком.
+    """
+    compiled = 0
+    for backend in engines.all():
+        if not isinstance(backend, DjangoTemplates):
+            continue
+        for name in template_names(backend.engine):
+            try:
+                backend.engine.get_template(name)
+            except Exception:
+                # Например, фрагменты JS или шаблоны чужих приложений
+                logger.debug('Шаблон %s не разобран', name, exc_info=True)
+            else:
+                compiled += 1
+    return compiled
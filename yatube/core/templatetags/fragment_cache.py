@@ -0,0 +1,64 @@
+from django import template
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.utils import make_template_fragment_key
+
+from core.cache import get_or_compute
+
+register = template.Library()
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, timeout, fragment_name, vary_on, stale):
+        self.nodelist = nodelist
+        self.timeout = timeout
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+        self.stale = stale
+
+    def render(self, context):
+        timeout = self.timeout.resolve(context)
+        if timeout is not None:
+            timeout = int(timeout)
+        stale = int(self.stale.resolve(context)) if self.stale else 60
+        try:
+            backend = caches['template_fragments']
+        except InvalidCacheBackendError:
+            backend = caches['default']
+        key = make_template_fragment_key(
+            self.fragment_name,
+            [var.resolve(context) for var in self.vary_on],
+        )
+        return get_or_compute(
+            key,
+            lambda: self.nodelist.render(context),
+            timeout,
+            stale_timeout=stale,
+            backend=backend,
+        )
+
+
+@register.tag
+def fragment_cache(parser, token):
+    """Как {% cache %}, но через core.cache.get_or_compute.
+
+    {% fragment_cache timeout name [var ...] [stale=seconds] %}
+    Фрагмент пересчитывает один процесс, остальные ждут его или отдают
+    устаревшую копию.
+    """
+    nodelist = parser.parse(('endfragment_cache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 3:
+        raise template.TemplateSyntaxError(
+            f'{tokens[0]!r} tag requires at least 2 arguments.'
+        )
+    stale = None
+    if tokens[-1].startswith('stale='):
+        stale = parser.compile_filter(tokens.pop()[len('stale='):])
+    return FragmentCacheNode(
+        nodelist,
+        parser.compile_filter(tokens[1]),
+        tokens[2],
+        [parser.compile_filter(var) for var in tokens[3:]],
+        stale,
+    )
@@ -1,6 +1,32 @@
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
 from http import HTTPStatus
+from io import StringIO
 
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import (RequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+from django.template import engines
+from django.test.utils import CaptureQueriesContext
+
+from core import prerender
+from core.cache import get_or_compute
+from core.cache_backends.sqlite import SQLiteCache
+from core.db_backends.sqlite3.base import configure
+from core.models import StoredFile
+from core.storages import ContentAddressedStorage
+from core.template_backends import precompile
+from core.views import server_error
 
 
 class ViewTestClass(TestCase):
@@ -8,3 +34,249 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class GetOrComputeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_value_computed_once(self):
+        calls = []
+        for _ in range(3):
+            value = get_or_compute('key', lambda: calls.append(1) or 'v', 60)
+        self.assertEqual(value, 'v')
+        self.assertEqual(len(calls), 1)
+
+    def test_stale_value_served_while_recomputing(self):
+        """Пока другой процесс пересчитывает, отдаётся старое значение."""
+        get_or_compute('key', lambda: 'old', timeout=0)
+        cache.add('key:lock', True)
+        self.assertEqual(get_or_compute('key', lambda: 'new', 0), 'old')
+        cache.delete('key:lock')
+        self.assertEqual(get_or_compute('key', lambda: 'new', 0), 'new')
+
+    def test_cold_key_waits_for_other_process(self):
+        """Без значения в кеше ждём результат процесса с блокировкой."""
+        cache.add('key:lock', True)
+
+        def other_process():
+            cache.delete('key:lock')
+            get_or_compute('key', lambda: 'first', 60)
+
+        timer = threading.Timer(0.1, other_process)
+        timer.start()
+        value = get_or_compute('key', lambda: 'second', 60)
+        timer.join()
+        self.assertEqual(value, 'first')
+
+
+class SQLiteCacheTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.path, {'OPTIONS': {'MAX_ENTRIES': 10}})
+
+    def test_shared_between_instances(self):
+        """Запись видна другому экземпляру, как другому воркеру."""
+        self.cache.set('key', {'value': 1})
+        other = SQLiteCache(self.path, {})
+        self.assertEqual(other.get('key'), {'value': 1})
+        other.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_timeout(self):
+        self.cache.set('key', 'value', 0)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 'new'))
+        self.assertFalse(self.cache.add('key', 'other'))
+        self.assertEqual(self.cache.get('key'), 'new')
+
+    def test_incr(self):
+        self.cache.set('counter', 1)
+        self.assertEqual(self.cache.incr('counter', 5), 6)
+        self.assertEqual(self.cache.get('counter'), 6)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_least_recently_used_evicted(self):
+        self.cache.set('hot', 'value')
+        for i in range(20):
+            self.cache._db.execute(
+                'UPDATE cache SET accessed = accessed + 100 WHERE key = ?',
+                (self.cache.make_key('hot'),),
+            )
+            self.cache.set(f'key{i}', i)
+        self.assertEqual(self.cache.get('hot'), 'value')
+        self.assertIsNone(self.cache.get('key0'))
+        count = self.cache._db.execute('SELECT COUNT(*) FROM cache')
+        self.assertLessEqual(
+            count.fetchone()[0], 10 + self.cache._cull_frequency
+        )
+
+    def test_size_checked_on_sample_of_writes(self):
+        """COUNT(*) выполняется лишь на каждой CULL_FREQUENCY-й записи."""
+        counts = []
+        self.cache._db.set_trace_callback(
+            lambda sql: 'COUNT(*)' in sql and counts.append(sql)
+        )
+        for i in range(9):
+            self.cache.set(f'key{i}', i)
+        self.assertEqual(len(counts), 9 // self.cache._cull_frequency)
+
+
+class PerformanceMiddlewareTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/')
+        timing = dict(
+            re.match(r'(\w+);dur=([\d.]+)', metric).groups()
+            for metric in response['Server-Timing'].split(', ')
+        )
+        self.assertEqual(
+            set(timing), {'db', 'template', 'cache', 'thumbnail', 'total'}
+        )
+        self.assertIn(
+            f'desc="{len(queries)} queries"', response['Server-Timing']
+        )
+        self.assertGreater(float(timing['template']), 0)
+        self.assertGreaterEqual(
+            float(timing['total']), float(timing['template'])
+        )
+        self.assertRegex(
+            response['Server-Timing'], r'cache;dur=[\d.]+;desc="\d+ hits'
+        )
+
+    @override_settings(PERFORMANCE_LOG_SAMPLE_RATE=1)
+    def test_sampled_log(self):
+        with self.assertLogs('core.middleware', 'INFO') as logs:
+            self.client.get('/')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'posts:index')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['queries'], 0)
+        self.assertGreater(record['cache_misses'], 0)
+
+
+class PrerenderTest(TestCase):
+    def setUp(self):
+        prerender.clear()
+
+    def test_static_page_rendered_once_for_anonymous(self):
+        first = self.client.get('/about/author/')
+        second = self.client.get('/about/author/')
+        self.assertTemplateUsed(first, 'about/author.html')
+        self.assertTemplateNotUsed(second, 'about/author.html')
+        self.assertEqual(first.content, second.content)
+        self.assertIn('Cookie', second['Vary'])
+
+    def test_authenticated_page_rendered(self):
+        user = get_user_model().objects.create_user(username='reader')
+        self.client.get('/about/author/')
+        self.client.force_login(user)
+        response = self.client.get('/about/author/')
+        self.assertTemplateUsed(response, 'about/author.html')
+        self.assertContains(response, 'reader')
+
+    def test_error_page_without_user(self):
+        """Страница 500 отдаётся, даже если до аутентификации не дошли."""
+        request = RequestFactory().get('/')
+        response = server_error(request)
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('Cookie', response['Vary'])
+
+    def test_precompile_fills_cached_loader(self):
+        params = settings.TEMPLATES[0]
+        cached = {
+            **params,
+            'OPTIONS': {
+                **params['OPTIONS'],
+                'loaders': [(
+                    'django.template.loaders.cached.Loader',
+                    settings.TEMPLATE_LOADERS,
+                )],
+            },
+        }
+        with override_settings(TEMPLATES=[cached]):
+            self.assertGreater(precompile(), 0)
+            loader = engines['django'].engine.template_loaders[0]
+            self.assertIn('about/author.html', loader.get_template_cache)
+
+
+class ContentAddressedStorageTest(TransactionTestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.storage = ContentAddressedStorage(location=media_root)
+
+    def test_identical_content_stored_once(self):
+        """Одинаковое содержимое получает одно имя в каталогах по хешу."""
+        first = self.storage.save('posts/a.JPG', ContentFile(b'image'))
+        second = self.storage.save('posts/b.jpg', ContentFile(b'image'))
+        other = self.storage.save('posts/c.jpg', ContentFile(b'other'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertRegex(first, r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}'
+                                r'\.jpg$')
+        self.assertTrue(self.storage.is_hashed(first))
+
+    def test_file_deleted_with_last_reference(self):
+        # Одну ссылку берёт само сохранение
+        name = self.storage.save('posts/a.jpg', ContentFile(b'image'))
+        self.storage.acquire(name)
+        self.storage.release(name)
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(StoredFile.objects.get(name=name).refs, 1)
+        self.storage.release(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(StoredFile.objects.exists())
+
+    def test_upload_after_last_release_keeps_file(self):
+        """Загрузка, пока файл ждёт удаления, оставляет файл на месте."""
+        name = self.storage.save('posts/a.jpg', ContentFile(b'image'))
+        with transaction.atomic():
+            self.storage.release(name)
+            # Та же картинка загружена до коммита снятия ссылки
+            self.assertEqual(
+                self.storage.save('posts/b.jpg', ContentFile(b'image')), name
+            )
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(StoredFile.objects.get(name=name).refs, 1)
+        # Удаление успело раньше загрузки: файл пишется заново
+        self.storage.release(name)
+        self.assertFalse(self.storage.exists(name))
+        self.storage.save('posts/c.jpg', ContentFile(b'image'))
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(StoredFile.objects.get(name=name).refs, 1)
+
+
+class SQLiteBackendTest(TestCase):
+    def test_pragmas_applied(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA foreign_keys')
+            self.assertEqual(cursor.fetchone()[0], 1)
+
+    def test_file_database_in_wal_mode(self):
+        """Тестовая база в памяти, поэтому WAL проверяется на файле."""
+        with tempfile.TemporaryDirectory() as directory:
+            db = sqlite3.connect(os.path.join(directory, 'db.sqlite3'))
+            configure(db, {'cache_size': -1000})
+            self.assertEqual(
+                db.execute('PRAGMA journal_mode').fetchone()[0], 'wal'
+            )
+            self.assertEqual(
+                db.execute('PRAGMA cache_size').fetchone()[0], -1000
+            )
+            db.close()
+
+
+class OptimizeDbTest(TransactionTestCase):
+    def test_optimize_db(self):
+        out = StringIO()
+        call_command('optimize_db', stdout=out)
+        self.assertIn('PRAGMA optimize', out.getvalue())
@@ -0,0 +1,52 @@
+"""Настройки, которые меняются только на время тестов.
+
+В settings.py их нет, чтобы остальные тесты проверяли рабочие настройки,
+в том числе обход шардов в потоках. manage.py test включает их через
+TEST_RUNNER, pytest — через conftest.py в корне репозитория.
+"""
+import copy
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+class TestSettings:
+    """Чистый кеш во временном каталоге вместо оставшегося от сервера.
+
+    Выборочный журнал запросов засорял бы вывод тестов. Миниатюры
+    готовятся сразу: фоновый поток не видит данных незавершённой
+    транзакции TestCase и переживает временный MEDIA_ROOT теста. Потоки
+    миниатюр проверяет ThumbnailTests со своим THUMBNAIL_WORKERS.
+    """
+
+    def enable(self):
+        self.directory = tempfile.mkdtemp()
+        caches = copy.deepcopy(settings.CACHES)
+        caches['default']['LOCATION'] = os.path.join(
+            self.directory, 'cache.sqlite3'
+        )
+        self.override = override_settings(
+            CACHES=caches,
+            PERFORMANCE_LOG_SAMPLE_RATE=0,
+            THUMBNAIL_WORKERS=0,
+        )
+        self.override.enable()
+
+    def disable(self):
+        self.override.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.test_settings = TestSettings()
+        self.test_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.test_settings.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,59 @@
+"""Сбор времени и счётчиков по частям обработки одного запроса.
+
+Запрос открывает PerformanceMiddleware; код, который хочет попасть в
+Server-Timing, вызывает record() или оборачивает работу в measure(). Вне
+запроса (команды, фоновые потоки) обе функции ничего не делают.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current = ContextVar('request_timing', default=None)
+
+
+class RequestTiming:
+    """Суммарная длительность и число событий по каждой метрике."""
+
+    def __init__(self):
+        self.durations = {}
+        self.counts = {}
+
+    def add(self, name, seconds=0.0, count=1):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + count
+
+    def sql(self, execute, sql, params, many, context):
+        """Обёртка для connection.execute_wrapper()."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add('db', time.perf_counter() - started)
+
+
+def start():
+    timing = RequestTiming()
+    return timing, _current.set(timing)
+
+
+def stop(token):
+    _current.reset(token)
+
+
+def record(name, seconds=0.0, count=1):
+    timing = _current.get()
+    if timing is not None:
+        timing.add(name, seconds, count)
+
+
+@contextmanager
+def measure(name):
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - started)
@@ -1,13 +1,15 @@
 from django.shortcuts import render
 
+from .prerender import render_static
+
 
 def page_not_found(request, exception):
     return render(request, 'core/404.html', {'path': request.path}, status=404)
 
 
 def csrf_failure(request, reason=''):
-    return render(request, 'core/403csrf.html')
+    return render_static(request, 'core/403csrf.html')
 
 
 def server_error(request):
-    return render(request, 'core/500.html', status=500)
+    return render_static(request, 'core/500.html', status=500)
@@ -1,9 +1,158 @@
+from django import forms
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import PAGE_VAR
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, Paginator
+from django.db.models.expressions import RawSQL
+from django.forms.models import ModelChoiceIterator
+from django.utils.functional import cached_property
 
+from core.cache import get_or_compute
+
+from . import fulltext
 from .models import Comment, Follow, Group, Post
+from .paginators import estimate_count
+
+
+def cached_choices(model):
+    """Варианты небольшой справочной модели из кеша: (pk, название)."""
+    return get_or_compute(
+        f'admin:choices:{model._meta.label_lower}',
+        lambda: [(obj.pk, str(obj)) for obj in model._default_manager.all()],
+        timeout=settings.ADMIN_CHOICES_TIMEOUT,
+    )
+
+
+class ApproximatePaginator(Paginator):
+    """Пагинатор списка в админке без COUNT(*) по всей таблице.
+
+    Небольшие выборки считаются точно. Для больших число строк оценивается:
+    без фильтров по статистике таблицы, с фильтрами подсчёт обрывается на
+    count_limit строк. Оборванный подсчёт отмечается в capped, и список
+    выводит «больше count_limit» вместо числа. Страницы за обрывом
+    открываются: для них строки считаются точно.
+    """
+    count_limit = 1000
+    capped = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimate_count(queryset)
+            if estimate > self.count_limit:
+                return estimate
+            return queryset.count()
+        counted = queryset[:self.count_limit + 1].count()
+        # Оценка по статистике всей таблицы к фильтру не относится
+        self.capped = counted > self.count_limit
+        return counted
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            if not self.capped:
+                raise
+        self.capped = False
+        self.__dict__['count'] = self.object_list.count()
+        # num_pages закешировано от оборванного подсчёта
+        self.__dict__.pop('num_pages', None)
+        return super().validate_number(number)
+
+
+class InputFilter(admin.SimpleListFilter):
+    """Фильтр с полем ввода: варианты не выбираются из базы целиком."""
+    template = 'admin/input_filter.html'
+    lookup = None
+
+    def lookups(self, request, model_admin):
+        # Без хотя бы одного варианта фильтр не выводится
+        return ((None, ''),)
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+        try:
+            return queryset.filter(**{self.lookup: self.value().strip()})
+        except (ValueError, ValidationError) as error:
+            raise IncorrectLookupParameters(error)
+
+    def choices(self, changelist):
+        # Остальные параметры списка уходят скрытыми полями формы
+        yield {
+            'query_parts': [
+                (name, value) for name, value in changelist.params.items()
+                if name not in (self.parameter_name, PAGE_VAR)
+            ],
+        }
+
+
+class AuthorFilter(InputFilter):
+    title = 'автору'
+    parameter_name = 'author'
+    lookup = 'author__username'
+
+
+class UserFilter(InputFilter):
+    title = 'пользователю'
+    parameter_name = 'user'
+    lookup = 'user__username'
+
+
+class PostFilter(InputFilter):
+    title = 'номеру поста'
+    parameter_name = 'post'
+    lookup = 'post_id'
+
 
+class CachedRelatedFilter(admin.RelatedFieldListFilter):
+    """Фильтр по справочной модели с закешированным списком вариантов."""
 
-class PostAdmin(admin.ModelAdmin):
+    def field_choices(self, field, request, model_admin):
+        return cached_choices(field.related_model)
+
+
+class CachedChoiceIterator(ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        yield from cached_choices(self.queryset.model)
+
+    def __len__(self):
+        return len(list(self))
+
+
+class CachedModelChoiceField(forms.ModelChoiceField):
+    """Выпадающий список, который не читает справочник на каждую форму."""
+    iterator = CachedChoiceIterator
+
+
+class FullTextSearchMixin:
+    """Поиск в админке по индексу FTS5 вместо LIKE '%...%'."""
+    search_table = None
+
+    def get_search_results(self, request, queryset, search_term):
+        match = fulltext.to_match(search_term)
+        if not match or not fulltext.available():
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        return queryset.filter(
+            pk__in=RawSQL(fulltext.match_sql(self.search_table), [match])
+        ), False
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Список, который открывается одинаково быстро на любом объёме."""
+    paginator = ApproximatePaginator
+    show_full_result_count = False
+    empty_value_display = '-пусто-'
+
+
+class PostAdmin(FullTextSearchMixin, LargeTableAdmin):
     list_display = (
         'pk',
         'text',
@@ -12,33 +161,51 @@ class PostAdmin(admin.ModelAdmin):
         'group',
     )
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
+    autocomplete_fields = ('author',)
     search_fields = ('text',)
-    list_filter = ('pub_date',)
-    empty_value_display = '-пусто-'
+    search_table = fulltext.POSTS_TABLE
+    list_filter = (
+        'pub_date',
+        ('group', CachedRelatedFilter),
+        AuthorFilter,
+    )
 
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'group':
+            kwargs['form_class'] = CachedModelChoiceField
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
-class CommentAdmin(admin.ModelAdmin):
+
+class CommentAdmin(FullTextSearchMixin, LargeTableAdmin):
     list_display = (
         'post',
         'text',
         'author',
     )
-    list_filter = ('post',)
+    list_filter = (PostFilter, AuthorFilter)
+    list_select_related = ('post', 'author')
+    autocomplete_fields = ('post', 'author')
     search_fields = ('text',)
-    empty_value_display = '-пусто-'
+    search_table = fulltext.COMMENTS_TABLE
 
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(LargeTableAdmin):
     list_display = (
         'user',
         'author',
     )
-    list_filter = ('author',)
-    search_fields = ('user',)
-    empty_value_display = '-пусто-'
+    list_filter = (UserFilter, AuthorFilter)
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    search_fields = ('user__username__exact', 'author__username__exact')
+
+
+class GroupAdmin(admin.ModelAdmin):
+    search_fields = ('title',)
 
 
 admin.site.register(Post, PostAdmin)
-admin.site.register(Group)
+admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Follow, FollowAdmin)
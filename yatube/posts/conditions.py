@@ -0,0 +1,63 @@
+"""Валидаторы условного GET для страниц постов.
+
+ETag строится из номеров поколений лент (posts.versions), поэтому
+меняется при любой записи, которая видна на странице, в том числе при
+удалении. Last-Modified не отдаётся: дата самой свежей записи не
+меняется при правке, удалении и новых комментариях.
+"""
+import datetime
+import hashlib
+
+from core.cache import get_versions
+
+from . import sharding, versions
+from .models import Group, Post, User
+
+
+def _etag(request, *names):
+    key = '|'.join((
+        get_versions(*names),
+        request.get_full_path(),
+        # Год выводится в подвале каждой страницы
+        str(datetime.date.today().year),
+    ))
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def _group_id(slug):
+    return Group.objects.filter(slug=slug).values_list('pk', flat=True).first()
+
+
+def _author_id(username):
+    return User.objects.filter(
+        username=username
+    ).values_list('pk', flat=True).first()
+
+
+def index_etag(request):
+    return _etag(request, versions.ALL_POSTS)
+
+
+def group_etag(request, slug):
+    group_id = _group_id(slug)
+    if group_id is not None:
+        return _etag(request, versions.group_feed(group_id))
+
+
+def profile_etag(request, username):
+    author_id = _author_id(username)
+    if author_id is not None:
+        return _etag(
+            request,
+            versions.author_feed(author_id),
+            versions.author_followers(author_id),
+        )
+
+
+def post_detail_etag(request, post_id):
+    author_id = sharding.on_post_shard(
+        Post.objects.filter(pk=post_id), post_id
+    ).values_list('author_id', flat=True).first()
+    if author_id is not None:
+        # Поколение автора меняется и при новых комментариях к его постам
+        return _etag(request, versions.author_feed(author_id))
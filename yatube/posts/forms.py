@@ -1,6 +1,8 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 from django.utils.translation import gettext_lazy as _
 
+from . import images
 from .models import Comment, Post
 
 
@@ -17,6 +19,21 @@ class PostForm(forms.ModelForm):
             'text': _('Текст нового поста'),
         }
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if image is False:
+            # Картинку убрали флажком «Очистить»
+            self.instance.image_width = None
+            self.instance.image_height = None
+            return image
+        # Только новая загрузка: уже сохранённую картинку не трогаем
+        if not isinstance(image, UploadedFile):
+            return image
+        image, width, height = images.normalize(image)
+        self.instance.image_width = width
+        self.instance.image_height = height
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
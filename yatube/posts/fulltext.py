@@ -0,0 +1,107 @@
+"""Полнотекстовый поиск по постам и комментариям на SQLite FTS5.
+
+Индексы — виртуальные таблицы FTS5 с rowid, равным id записи. Их
+поддерживают сигналы posts.signals, а заново строит команда
+rebuild_search_index. На других СУБД индекс не ведётся и поиск пуст.
+Индекс у каждого шарда свой, поиск опрашивает все шарды.
+"""
+import base64
+import binascii
+import re
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, connection, connections, router
+
+from . import sharding
+
+POSTS_TABLE = 'posts_post_fts'
+COMMENTS_TABLE = 'posts_comment_fts'
+TABLES = (POSTS_TABLE, COMMENTS_TABLE)
+MODELS = {POSTS_TABLE: 'posts.Post', COMMENTS_TABLE: 'posts.Comment'}
+
+WORD = re.compile(r'\w+')
+
+
+def available():
+    return connection.vendor == 'sqlite'
+
+
+def to_match(query):
+    """Запрос пользователя в безопасное выражение FTS5.
+
+    Каждое слово ищется по префиксу, все слова должны встретиться.
+    """
+    return ' '.join(f'"{word}"*' for word in WORD.findall(query))
+
+
+def index(table, pk, text, using=DEFAULT_DB_ALIAS):
+    if not available():
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE rowid = %s', [pk])
+        cursor.execute(
+            f'INSERT INTO {table} (rowid, text) VALUES (%s, %s)', [pk, text]
+        )
+
+
+def unindex(table, pk, using=DEFAULT_DB_ALIAS):
+    if not available():
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE rowid = %s', [pk])
+
+
+def match_sql(table):
+    """Подзапрос id записей, подходящих под выражение to_match()."""
+    return f'SELECT rowid FROM {table} WHERE {table} MATCH %s'
+
+
+def encode_cursor(rank, pk):
+    raw = f'{rank!r}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        rank, pk = base64.urlsafe_b64decode(
+            padded.encode()
+        ).decode().split('|')
+        return float(rank), int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+
+
+def search(table, query, limit, after=None):
+    """Страница результатов по релевантности: [(id, курсор), ...].
+
+    Следующая страница запрашивается с курсором последнего результата.
+    """
+    match = to_match(query)
+    if not match or not available():
+        return []
+    sql = f'SELECT rowid, rank FROM {table} WHERE {table} MATCH %s'
+    params = [match]
+    position = decode_cursor(after) if after else None
+    if position is not None:
+        sql += ' AND (rank > %s OR (rank = %s AND rowid > %s))'
+        params += [position[0], position[0], position[1]]
+    sql += ' ORDER BY rank, rowid LIMIT %s'
+    params.append(limit)
+
+    def search_shard(using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    if sharding.enabled():
+        found = sharding.merge(
+            sharding.scatter(search_shard), key=lambda row: (row[1], row[0]),
+            limit=limit,
+        )
+    else:
+        # Поиск читает из той же базы, что и ORM, в том числе из реплики
+        found = search_shard(
+            router.db_for_read(apps.get_model(MODELS[table]))
+        )
+    return [(pk, encode_cursor(rank, pk)) for pk, rank in found]
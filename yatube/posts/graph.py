@@ -0,0 +1,77 @@
+"""Граф подписок в общем кеше.
+
+Для каждого пользователя хранятся id авторов, на которых он подписан,
+массивом array (8 байт на подписку, от новых к старым), и число его
+подписчиков. Проверка подписки и список авторов для ленты берутся из
+кеша без запросов к базе. После подписки или отписки массив читается из
+базы заново, а счётчик сдвигается атомарным incr/decr; вытесненные
+ключи пересобираются при первом чтении. Ключи без поколений живут
+бессрочно, поэтому собираются только из основной базы, не с реплики.
+"""
+from array import array
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+FOLLOWING_KEY = 'graph:following:{}'
+FOLLOWERS_COUNT_KEY = 'graph:followers:{}'
+
+
+def _load_following(user_id):
+    from .models import Follow
+
+    ids = array('q', Follow.objects.using(DEFAULT_DB_ALIAS).filter(
+        user_id=user_id
+    ).order_by('-pk').values_list('author_id', flat=True))
+    cache.set(FOLLOWING_KEY.format(user_id), ids, None)
+    return ids
+
+
+def following_ids(user_id):
+    """Авторы, на которых подписан пользователь, от новых к старым."""
+    if user_id is None:
+        return array('q')
+    ids = cache.get(FOLLOWING_KEY.format(user_id))
+    if ids is None:
+        ids = _load_following(user_id)
+    return ids
+
+
+def is_following(user_id, author_id):
+    return author_id in following_ids(user_id)
+
+
+def following_count(user_id):
+    return len(following_ids(user_id))
+
+
+def followers_count(author_id):
+    from .models import Follow
+
+    key = FOLLOWERS_COUNT_KEY.format(author_id)
+    count = cache.get(key)
+    if count is None:
+        count = Follow.objects.using(DEFAULT_DB_ALIAS).filter(
+            author_id=author_id
+        ).count()
+        # add, а не set: не затираем значение, которое уже сдвинули
+        cache.add(key, count, None)
+    return count
+
+
+def _change_followers_count(author_id, delta):
+    try:
+        cache.incr(FOLLOWERS_COUNT_KEY.format(author_id), delta)
+    except ValueError:
+        # Ключа нет: его соберёт первое чтение
+        pass
+
+
+def followed(user_id, author_id):
+    _load_following(user_id)
+    _change_followers_count(author_id, 1)
+
+
+def unfollowed(user_id, author_id):
+    _load_following(user_id)
+    _change_followers_count(author_id, -1)
@@ -0,0 +1,99 @@
+"""Приведение загруженных картинок постов к одному виду.
+
+Оригинал не сохраняется: картинка уменьшается до POST_IMAGE_MAX_SIDE по
+большей стороне, поворачивается по EXIF и перекодируется без метаданных
+в прогрессивный JPEG (или WebP) не больше POST_IMAGE_MAX_BYTES. Картинки
+с числом пикселей больше POST_IMAGE_MAX_PIXELS отклоняются до декодирования.
+"""
+import os
+import tempfile
+import warnings
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from PIL import Image, ImageOps
+
+# Шаги качества, по которым идём вниз, пока файл не уложится в лимит
+QUALITY_STEPS = (85, 75, 65, 55, 45)
+# Выше этого размера результат перекодирования уходит из памяти на диск
+SPOOL_SIZE = 1024 * 1024
+
+EXTENSIONS = {'JPEG': '.jpg', 'WEBP': '.webp'}
+
+
+def _open(upload):
+    upload.seek(0)
+    try:
+        with warnings.catch_warnings():
+            # Предупреждение Pillow о «бомбе» здесь превращается в отказ
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            image = Image.open(upload)
+    except (Image.DecompressionBombWarning, Image.DecompressionBombError):
+        raise ValidationError(
+            'Картинка слишком большая.', code='image_too_large'
+        )
+    except (OSError, SyntaxError):
+        raise ValidationError('Не удалось прочитать картинку.',
+                              code='invalid_image')
+    # Image.open() читает только заголовок; размер известен до декодирования
+    width, height = image.size
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Картинка слишком большая: не больше %(limit)d Мпикс.',
+            code='image_too_large',
+            params={'limit': settings.POST_IMAGE_MAX_PIXELS // 10 ** 6},
+        )
+    return image
+
+
+def _prepare(image, image_format):
+    side = settings.POST_IMAGE_MAX_SIDE
+    # JPEG декодируется сразу в уменьшенном масштабе: памяти нужно в разы
+    # меньше, чем на полный кадр
+    image.draft('RGB', (side, side))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((side, side), Image.LANCZOS)
+    if image_format == 'WEBP' and image.mode in ('RGBA', 'LA', 'P'):
+        return image.convert('RGBA')
+    if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+        # У JPEG нет прозрачности: подкладываем белый фон
+        rgba = image.convert('RGBA')
+        image = Image.new('RGB', rgba.size, 'white')
+        image.paste(rgba, mask=rgba.getchannel('A'))
+        return image
+    return image.convert('RGB')
+
+
+def _encode(image, image_format):
+    output = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    for quality in QUALITY_STEPS:
+        output.seek(0)
+        output.truncate()
+        # Метаданные (EXIF, ICC, комментарии) не передаются и не сохраняются
+        image.save(
+            output, image_format, quality=quality, optimize=True,
+            progressive=True,
+        )
+        if output.tell() <= settings.POST_IMAGE_MAX_BYTES:
+            break
+    output.seek(0)
+    return output
+
+
+def normalize(upload):
+    """Перекодированная картинка: (файл, ширина, высота).
+
+    upload читается как файл, поэтому большая загрузка, которую Django
+    держит во временном файле, в память целиком не попадает.
+    """
+    image_format = settings.POST_IMAGE_FORMAT
+    with _open(upload) as image:
+        try:
+            image = _prepare(image, image_format)
+        except (OSError, SyntaxError):
+            raise ValidationError('Не удалось прочитать картинку.',
+                                  code='invalid_image')
+    output = _encode(image, image_format)
+    stem = os.path.splitext(os.path.basename(upload.name))[0]
+    return File(output, name=stem + EXTENSIONS[image_format]), *image.size
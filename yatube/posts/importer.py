@@ -0,0 +1,297 @@
+"""Потоковый импорт постов, комментариев и подписок.
+
+Записи читаются по одной и обрабатываются пачками: авторы, группы и посты
+для пачки ищутся несколькими запросами IN (...), строки вставляются
+многострочными INSERT в отдельной транзакции на пачку. В памяти держится
+одна пачка и ограниченный кеш найденных пользователей и групп. Запись,
+которую не удалось прочитать или у которой type не строка, считается
+в skipped под типом INVALID.
+
+Вставка не вызывает сигналы, поэтому счётчики, полнотекстовый индекс
+и ленты подписок после импорта пересчитываются отдельно, см. finish().
+"""
+import csv
+import json
+import time
+from collections import Counter
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connections, router, transaction
+from django.db.models.sql import InsertQuery
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.cache import bump_versions
+
+from . import fulltext, versions
+from .models import Comment, FeedEntry, Follow, Group, Post
+
+User = get_user_model()
+
+RECORD_TYPES = ('post', 'comment', 'follow')
+
+
+# Тип записи, которую не удалось прочитать: она считается в skipped
+INVALID = 'invalid'
+
+# Типы значений, по которым ищутся пользователи и группы; списки и
+# объекты из JSON ключами быть не могут
+KEY_TYPES = (str, int)
+
+
+def _encoded(text):
+    """Строка из файла с errors='surrogateescape' без неверных байтов."""
+    # Неверные байты становятся суррогатами и не кодируются обратно
+    text.encode('utf-8')
+    return text
+
+
+def read_jsonl(lines):
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(_encoded(line))
+        except ValueError:
+            # В том числе UnicodeError: одна битая строка не обрывает импорт
+            yield {'type': INVALID}
+            continue
+        yield record if isinstance(record, dict) else {'type': INVALID}
+
+
+def read_csv(lines):
+    rows = csv.DictReader(lines)
+    while True:
+        try:
+            row = next(rows)
+            for key, value in row.items():
+                # Лишние ячейки строки DictReader собирает в список
+                for text in value if isinstance(value, list) else [value]:
+                    if text:
+                        _encoded(text)
+                if key:
+                    _encoded(key)
+        except StopIteration:
+            return
+        except (csv.Error, ValueError):
+            yield {'type': INVALID}
+            continue
+        # Пустая ячейка CSV означает отсутствие значения
+        yield {key: value or None for key, value in row.items()}
+
+
+class RecordError(ValueError):
+    """Запись нельзя импортировать."""
+
+
+class Importer:
+    """Импорт потока записей-словарей с полем type."""
+    lookup_cache_size = 100000
+
+    def __init__(self, batch_size=2000, create_missing=False,
+                 default_type='post', progress=None):
+        self.batch_size = batch_size
+        self.create_missing = create_missing
+        self.default_type = default_type
+        self.progress = progress
+        self.users = {}
+        self.groups = {}
+        self.imported = Counter()
+        self.skipped = Counter()
+        # Авторы, чьи посты попали в ленты подписчиков, и группы постов
+        self.touched_authors = set()
+        self.touched_groups = set()
+
+    def run(self, records):
+        records = iter(records)
+        started = time.perf_counter()
+        while True:
+            batch = list(islice(records, self.batch_size))
+            if not batch:
+                break
+            self.import_batch(batch)
+            if self.progress:
+                self.progress(
+                    sum(self.imported.values()),
+                    time.perf_counter() - started,
+                )
+        return self.imported
+
+    def import_batch(self, batch):
+        by_type = {record_type: [] for record_type in RECORD_TYPES}
+        for record in batch:
+            record_type = record.get('type') or self.default_type
+            if not isinstance(record_type, str):
+                record_type = INVALID
+            if record_type in by_type:
+                by_type[record_type].append(record)
+            else:
+                self.skipped[record_type] += 1
+        self.resolve(
+            self.users, User, 'username',
+            (record[key] for record in batch for key in ('author', 'user')
+             if record.get(key) and isinstance(record[key], KEY_TYPES)),
+            lambda username: User(username=username, password='!'),
+        )
+        self.resolve(
+            self.groups, Group, 'slug',
+            (record['group'] for record in by_type['post']
+             if record.get('group')
+             and isinstance(record['group'], KEY_TYPES)),
+            lambda slug: Group(title=slug, slug=slug, description=''),
+        )
+        with transaction.atomic():
+            self.insert(Post, by_type['post'], self.build_post)
+            # Посты из той же пачки уже вставлены и находятся по id
+            post_ids = set(Post.objects.filter(pk__in={
+                int(record['post']) for record in by_type['comment']
+                if str(record.get('post') or '').isdigit()
+            }).values_list('pk', flat=True))
+            self.insert(
+                Comment,
+                by_type['comment'],
+                lambda record: self.build_comment(record, post_ids),
+            )
+            self.insert(Follow, by_type['follow'], self.build_follow)
+
+    def insert(self, model, records, build):
+        objects = []
+        for record in records:
+            try:
+                objects.append(build(record))
+            except (RecordError, KeyError, TypeError, ValueError):
+                self.skipped[model._meta.model_name] += 1
+        self.save(model, objects)
+        self.imported[model._meta.model_name] += len(objects)
+
+    @staticmethod
+    def save(model, objects):
+        """Вставка как в bulk_create, но без pre_save полей.
+
+        Поля с auto_now_add в pre_save получают текущее время, а даты из
+        старой системы нужно сохранить. Вставка с raw=True, как у
+        loaddata, берёт значения с объектов как есть.
+        """
+        opts = model._meta
+        connection = connections[router.db_for_write(model)]
+        with_pk = [obj for obj in objects if obj.pk is not None]
+        without_pk = [obj for obj in objects if obj.pk is None]
+        for rows, fields in (
+            (with_pk, opts.concrete_fields),
+            (without_pk, [
+                field for field in opts.concrete_fields
+                if field is not opts.auto_field
+            ]),
+        ):
+            step = connection.ops.bulk_batch_size(fields, rows) or 1
+            for start in range(0, len(rows), step):
+                # Повторный импорт тех же id и подписок не дублирует строки
+                query = InsertQuery(model, ignore_conflicts=True)
+                query.insert_values(
+                    fields, rows[start:start + step], raw=True
+                )
+                with connection.cursor() as cursor:
+                    for sql, params in query.get_compiler(
+                        connection=connection
+                    ).as_sql():
+                        cursor.execute(sql, params)
+
+    def resolve(self, found, model, field, keys, build):
+        """Дополняет found ключами пачки одним-двумя запросами IN (...)."""
+        keys = set(keys)
+        missing = keys - found.keys()
+        if not missing:
+            return
+        # Кеш ограничен, чтобы память не росла с размером импорта
+        if len(found) + len(missing) > self.lookup_cache_size:
+            found.clear()
+            missing = keys
+        lookup = f'{field}__in'
+        rows = model.objects.filter(**{lookup: missing}).values_list(
+            field, 'pk'
+        )
+        found.update(rows)
+        if self.create_missing and not missing <= found.keys():
+            model.objects.bulk_create(
+                build(key) for key in missing - found.keys()
+            )
+            found.update(rows.all())
+
+    def user_id(self, username):
+        if not isinstance(username, KEY_TYPES) or username not in self.users:
+            raise RecordError(f'Нет пользователя {username}')
+        return self.users[username]
+
+    @staticmethod
+    def date(value):
+        if not value:
+            return timezone.now()
+        date = parse_datetime(value)
+        if date is None:
+            raise RecordError(f'Неверная дата {value}')
+        if timezone.is_naive(date):
+            date = timezone.make_aware(date)
+        return date
+
+    def build_post(self, record):
+        group_id = None
+        if record.get('group'):
+            if (not isinstance(record['group'], KEY_TYPES)
+                    or record['group'] not in self.groups):
+                raise RecordError(f'Нет группы {record["group"]}')
+            group_id = self.groups[record['group']]
+        post = Post(
+            pk=record.get('id') or None,
+            author_id=self.user_id(record['author']),
+            group_id=group_id,
+            text=record['text'],
+            pub_date=self.date(record.get('pub_date')),
+            image=record.get('image') or '',
+        )
+        self.touched_authors.add(post.author_id)
+        if group_id is not None:
+            self.touched_groups.add(group_id)
+        return post
+
+    def build_comment(self, record, post_ids):
+        post_id = int(record['post'])
+        if post_id not in post_ids:
+            raise RecordError(f'Нет поста {post_id}')
+        return Comment(
+            post_id=post_id,
+            author_id=self.user_id(record['author']),
+            text=record['text'],
+            created=self.date(record.get('created')),
+        )
+
+    def build_follow(self, record):
+        follow = Follow(
+            user_id=self.user_id(record['user']),
+            author_id=self.user_id(record['author']),
+        )
+        if follow.user_id == follow.author_id:
+            raise RecordError('Подписка на себя')
+        self.touched_authors.add(follow.author_id)
+        return follow
+
+    def finish(self, stdout=None):
+        """Пересчитывает то, что при обычной записи делают сигналы."""
+        call_command('rebuild_counters', stdout=stdout)
+        if fulltext.available():
+            call_command('rebuild_search_index', stdout=stdout)
+        pulled = FeedEntry.objects.pull_author_ids()
+        follows = Follow.objects.filter(
+            author_id__in=self.touched_authors - pulled
+        ).values_list('user_id', 'author_id')
+        followers = set()
+        for user_id, author_id in follows.iterator():
+            FeedEntry.objects.backfill(user_id, author_id)
+            followers.add(user_id)
+        bump_versions(
+            versions.ALL_POSTS,
+            *(versions.author_feed(pk) for pk in self.touched_authors),
+            *(versions.group_feed(pk) for pk in self.touched_groups),
+            *(versions.follower_feed(pk) for pk in followers),
+        )
@@ -0,0 +1,201 @@
+import json
+import os
+import statistics
+import tempfile
+import time
+from contextlib import ExitStack, contextmanager
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_databases,
+    setup_test_environment, teardown_databases, teardown_test_environment,
+)
+from django.urls import reverse
+
+from posts.models import AuthorStats, Follow, Group, Post
+
+User = get_user_model()
+
+BASELINE = os.path.join(settings.BASE_DIR, 'benchmarks', 'views.json')
+
+
+def dataset(posts):
+    """Объёмы данных для набора с заданным числом постов."""
+    users = max(20, posts // 10)
+    return {
+        'users': users,
+        'groups': max(5, posts // 500),
+        'posts': posts,
+        'comments': posts * 2,
+        'follows': users * 5,
+    }
+
+
+@contextmanager
+def capture_queries():
+    """Запросы ко всем базам: чтения могут уйти на реплики."""
+    with ExitStack() as stack:
+        yield [
+            stack.enter_context(CaptureQueriesContext(connection))
+            for connection in connections.all()
+        ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Меряет задержку (p50/p95), число запросов к базе и размер ответа '
+        'каждого представления постов на наборах данных разного размера. '
+        'Данные создаёт seed_data в тестовой базе, рабочая база и кеш не '
+        'затрагиваются. Результат сравнивается с сохранённым базовым.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', default='1000,10000',
+            help='Числа постов в наборах данных через запятую.',
+        )
+        parser.add_argument(
+            '--requests', type=int, default=30,
+            help='Сколько раз запрашивать каждое представление.',
+        )
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--baseline', default=BASELINE)
+        parser.add_argument(
+            '--save-baseline', action='store_true',
+            help='Записать результат как новый базовый.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes: числа через запятую')
+        baseline = {}
+        if os.path.exists(options['baseline']):
+            with open(options['baseline']) as file:
+                baseline = json.load(file)
+
+        setup_test_environment(debug=False)
+        databases = setup_databases(verbosity=0, interactive=False)
+        try:
+            with tempfile.TemporaryDirectory() as directory, \
+                    override_settings(CACHES={'default': {
+                        'BACKEND': settings.CACHES['default']['BACKEND'],
+                        'LOCATION': os.path.join(directory, 'cache.sqlite3'),
+                    }}):
+                results = {
+                    str(size): self.run(size, options)
+                    for size in sizes
+                }
+        finally:
+            teardown_databases(databases, verbosity=0)
+            teardown_test_environment()
+
+        self.print_results(results, baseline)
+        if options['save_baseline']:
+            os.makedirs(os.path.dirname(options['baseline']), exist_ok=True)
+            with open(options['baseline'], 'w') as file:
+                json.dump(results, file, indent=2, sort_keys=True)
+                file.write('\n')
+            self.stdout.write(f'Базовый результат: {options["baseline"]}')
+
+    def run(self, size, options):
+        call_command('flush', interactive=False, verbosity=0)
+        call_command(
+            'seed_data', seed=options['seed'], stdout=StringIO(),
+            **dataset(size),
+        )
+        group = Group.objects.annotate(
+            total=Count('posts')
+        ).order_by('-total').first()
+        author = AuthorStats.objects.order_by('-posts_count').first().author
+        post = Post.objects.order_by('-comments_count').first()
+        reader = Follow.objects.values('user').annotate(
+            total=Count('pk')
+        ).order_by('-total').first()['user']
+
+        client = Client()
+        reader_client = Client()
+        reader_client.force_login(User.objects.get(pk=reader))
+        views = {
+            'index': lambda: client.get(reverse('posts:index')),
+            'group_posts': lambda: client.get(
+                reverse('posts:group_list', args=(group.slug,))
+            ),
+            'profile': lambda: client.get(
+                reverse('posts:profile', args=(author.username,))
+            ),
+            'post_detail': lambda: client.get(
+                reverse('posts:post_detail', args=(post.pk,))
+            ),
+            'follow_index': lambda: reader_client.get(
+                reverse('posts:follow_index')
+            ),
+            'add_comment': lambda: reader_client.post(
+                reverse('posts:add_comment', args=(post.pk,)),
+                {'text': 'Комментарий из бенчмарка'},
+            ),
+        }
+        return {
+            name: self.measure(request, options['requests'])
+            for name, request in views.items()
+        }
+
+    @staticmethod
+    def measure(request, repeat):
+        """Первый запрос с холодным кешем, затем repeat тёплых."""
+        cache.clear()
+        started = time.perf_counter()
+        with capture_queries() as queries:
+            response = request()
+        cold = time.perf_counter() - started
+        # Журнал запросов очищается в начале каждого следующего запроса
+        cold_queries = sum(map(len, queries))
+        with capture_queries() as queries:
+            request()
+        warm_queries = sum(map(len, queries))
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            request()
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        return {
+            'cold_ms': round(cold * 1000, 2),
+            'p50_ms': round(statistics.median(timings) * 1000, 2),
+            'p95_ms': round(
+                timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+                * 1000, 2
+            ),
+            'queries': cold_queries,
+            'warm_queries': warm_queries,
+            'bytes': len(response.content),
+        }
+
+    def print_results(self, results, baseline):
+        self.stdout.write(
+            f'{"posts":>7} {"view":<13} {"cold":>8} {"p50":>8} {"p95":>8} '
+            f'{"queries":>8} {"warm":>5} {"bytes":>8} {"Δp50":>7} '
+            f'{"Δqueries":>8}'
+        )
+        for size, views in results.items():
+            for name, row in views.items():
+                base = baseline.get(size, {}).get(name)
+                change = queries = ''
+                if base:
+                    change = f'{row["p50_ms"] / base["p50_ms"] - 1:+.0%}'
+                    queries = f'{row["queries"] - base["queries"]:+d}'
+                self.stdout.write(
+                    f'{size:>7} {name:<13} {row["cold_ms"]:>8.1f} '
+                    f'{row["p50_ms"]:>8.1f} {row["p95_ms"]:>8.1f} '
+                    f'{row["queries"]:>8} {row["warm_queries"]:>5} '
+                    f'{row["bytes"]:>8} {change:>7} {queries:>8}'
+                )
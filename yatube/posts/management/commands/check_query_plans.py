@@ -0,0 +1,75 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from posts.models import Comment, FeedEntry, Post
+from posts.paginators import (CommentPaginator, CursorPaginator,
+                              FeedPaginator)
+from posts.views import COMMENTS_PAGE, FILTER
+
+# Признаки полного прохода по таблице или сортировки во временной структуре
+BAD_PLANS = {
+    'sqlite': (
+        re.compile(r'\bSCAN (TABLE )?\w+(?! USING)( |$)'),
+        re.compile(r'USE TEMP B-TREE'),
+    ),
+    'postgresql': (
+        re.compile(r'Seq Scan'),
+        re.compile(r'\bSort\b'),
+    ),
+    'mysql': (
+        re.compile(r'\bALL\b'),
+        re.compile(r'Using (filesort|temporary)'),
+    ),
+}
+
+
+def feed_querysets():
+    """Запросы, которые выполняют ленты и страница поста."""
+    feeds = {
+        'index': CursorPaginator(Post.objects.for_feed(), FILTER),
+        'group_posts': CursorPaginator(
+            Post.objects.for_feed().filter(group_id=1), FILTER
+        ),
+        'profile': CursorPaginator(
+            Post.objects.for_feed().filter(author_id=1), FILTER
+        ),
+        'follow_index': FeedPaginator(
+            FeedEntry.objects.filter(user_id=1), FILTER
+        ),
+        'post_detail comments': CommentPaginator(
+            Comment.objects.filter(post_id=1), COMMENTS_PAGE
+        ),
+    }
+    position = (timezone.now(), 1)
+    querysets = {}
+    for name, paginator in feeds.items():
+        querysets[name] = paginator.object_list
+        querysets[f'{name} (after)'] = paginator.filter_after(*position)
+        querysets[f'{name} (before)'] = paginator.filter_before(*position)
+    return querysets
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверяет через EXPLAIN, что запросы лент идут по индексам '
+        'без полного прохода таблицы и сортировки.'
+    )
+
+    def handle(self, *args, **options):
+        patterns = BAD_PLANS.get(connection.vendor, ())
+        failed = []
+        for name, queryset in feed_querysets().items():
+            plan = queryset[:FILTER + 1].explain()
+            bad = any(pattern.search(plan) for pattern in patterns)
+            if bad:
+                failed.append(name)
+            style = self.style.ERROR if bad else self.style.SUCCESS
+            self.stdout.write(style(name))
+            self.stdout.write(plan)
+        if failed:
+            raise CommandError(
+                'Запросы без подходящего индекса: ' + ', '.join(failed)
+            )
@@ -0,0 +1,155 @@
+import io
+import sys
+import time
+from itertools import count
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+
+from posts import sharding
+from posts.importer import Importer, read_csv, read_jsonl
+from posts.models import Post
+
+# Как часто печатать прогресс, секунд
+PROGRESS_INTERVAL = 5
+
+
+class Command(BaseCommand):
+    help = (
+        'Импортирует посты, комментарии и подписки из JSONL или CSV '
+        'пачками через bulk_create. Тип записи берётся из поля type. '
+        'С --synthetic меряет скорость импорта на сгенерированных записях.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Файл с записями, "-" — стандартный ввод.',
+        )
+        parser.add_argument(
+            '--format', choices=('jsonl', 'csv'),
+            help='Формат файла; по умолчанию по расширению.',
+        )
+        parser.add_argument(
+            '--type', default='post', choices=('post', 'comment', 'follow'),
+            help='Тип записей без поля type.',
+        )
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument(
+            '--create-missing', action='store_true',
+            help='Создавать неизвестных пользователей и группы.',
+        )
+        parser.add_argument(
+            '--no-rebuild', action='store_true',
+            help='Не пересчитывать счётчики, поиск и ленты после импорта.',
+        )
+        parser.add_argument(
+            '--synthetic', type=int, metavar='N',
+            help='Импортировать N сгенерированных постов с комментариями '
+                 'и подписками и напечатать скорость.',
+        )
+        parser.add_argument('--synthetic-authors', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if sharding.enabled():
+            # bulk_create пишет в одну базу мимо выдачи id и маршрутизации
+            raise CommandError(
+                'Загрузите данные до включения шардов и разнесите их '
+                'командой reshard_posts'
+            )
+        self.last_report = 0
+        importer = Importer(
+            batch_size=options['batch_size'],
+            create_missing=(
+                options['create_missing'] or bool(options['synthetic'])
+            ),
+            default_type=options['type'],
+            progress=self.report,
+        )
+        started = time.perf_counter()
+        if options['synthetic']:
+            imported = importer.run(self.synthetic(
+                options['synthetic'], options['synthetic_authors']
+            ))
+        else:
+            with self.open(options['path']) as lines:
+                imported = importer.run(
+                    self.reader(options['path'], options['format'])(lines)
+                )
+        elapsed = time.perf_counter() - started
+        total = sum(imported.values())
+        self.stdout.write(
+            f'Обработано записей: {total} за {elapsed:.1f} с '
+            f'({total / max(elapsed, 1e-9):.0f} в секунду)'
+        )
+        for name in sorted(imported.keys() | importer.skipped.keys()):
+            self.stdout.write(
+                f'  {name}: {imported[name]}, '
+                f'пропущено {importer.skipped[name]}'
+            )
+        if not options['no_rebuild']:
+            started = time.perf_counter()
+            importer.finish(stdout=self.stdout)
+            self.stdout.write(
+                f'Пересчёт после импорта: '
+                f'{time.perf_counter() - started:.1f} с'
+            )
+        self.stdout.write(self.style.SUCCESS('Импорт завершён'))
+
+    @staticmethod
+    def open(path):
+        # Неверные байты читаются суррогатами, и читатель пропускает
+        # только содержащую их запись
+        if path == '-':
+            return io.TextIOWrapper(
+                sys.stdin.buffer, encoding='utf-8',
+                errors='surrogateescape', newline='',
+            )
+        try:
+            return open(
+                path, encoding='utf-8', errors='surrogateescape', newline=''
+            )
+        except OSError as error:
+            raise CommandError(error)
+
+    @staticmethod
+    def reader(path, file_format):
+        if file_format is None:
+            file_format = 'csv' if path.endswith('.csv') else 'jsonl'
+        return read_csv if file_format == 'csv' else read_jsonl
+
+    def report(self, done, elapsed):
+        if elapsed - self.last_report < PROGRESS_INTERVAL:
+            return
+        self.last_report = elapsed
+        self.stdout.write(
+            f'  {done} записей, {done / elapsed:.0f} в секунду'
+        )
+
+    @staticmethod
+    def synthetic(posts, authors):
+        """Посты с явными id, по комментарию к каждому и подписки."""
+        start = (Post.objects.aggregate(Max('pk'))['pk__max'] or 0) + 1
+        for number, post_id in enumerate(count(start)):
+            if number == posts:
+                return
+            author = f'synthetic{number % authors}'
+            yield {
+                'type': 'post',
+                'id': post_id,
+                'author': author,
+                'group': f'synthetic-{number % 10}',
+                'text': f'Синтетический пост номер {number}',
+            }
+            yield {
+                'type': 'comment',
+                'post': post_id,
+                'author': f'synthetic{(number + 1) % authors}',
+                'text': f'Комментарий к посту {number}',
+            }
+            if number < authors:
+                yield {
+                    'type': 'follow',
+                    'user': author,
+                    'author': f'synthetic{(number + 1) % authors}',
+                }
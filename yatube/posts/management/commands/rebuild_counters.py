@@ -0,0 +1,51 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from posts import sharding
+from posts.models import AuthorStats, Comment, Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики комментариев постов на каждом шарде и '
+        'счётчики постов авторов по всем шардам.'
+    )
+
+    def handle(self, *args, **options):
+        fixed_posts = 0
+        posts_counts = Counter()
+        for using in sharding.shards():
+            fixed_posts += self.fix_comments_count(using)
+            posts_counts.update(dict(
+                Post.objects.using(using).order_by().values(
+                    'author'
+                ).annotate(total=Count('pk')).values_list('author', 'total')
+            ))
+        with transaction.atomic():
+            AuthorStats.objects.all().delete()
+            AuthorStats.objects.bulk_create(
+                (
+                    AuthorStats(author_id=author_id, posts_count=total)
+                    for author_id, total in posts_counts.items()
+                ),
+                batch_size=500,
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено счётчиков комментариев: {fixed_posts}; '
+            f'счётчиков авторов: {len(posts_counts)}'
+        ))
+
+    @staticmethod
+    def fix_comments_count(using):
+        # Комментарии лежат на шарде своего поста
+        comments = Comment.objects.using(using).filter(
+            post=OuterRef('pk')
+        ).values('post').annotate(total=Count('pk')).values('total')
+        with transaction.atomic(using):
+            return Post.objects.using(using).exclude(
+                comments_count=Coalesce(Subquery(comments), 0)
+            ).update(comments_count=Coalesce(Subquery(comments), 0))
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+
+from posts import fulltext, sharding
+from posts.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Заново строит полнотекстовые индексы постов и комментариев '
+        'на каждом шарде, читая таблицы порциями.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if not fulltext.available():
+            raise CommandError(
+                'Полнотекстовый поиск работает только на SQLite'
+            )
+        for using in sharding.shards():
+            for table, model in (
+                (fulltext.POSTS_TABLE, Post),
+                (fulltext.COMMENTS_TABLE, Comment),
+            ):
+                total = self.rebuild(
+                    table, model, options['chunk_size'], using
+                )
+                self.stdout.write(
+                    self.style.SUCCESS(f'{using} {table}: {total}')
+                )
+
+    @staticmethod
+    def rebuild(table, model, chunk_size, using):
+        connection = connections[using]
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table}')
+        total = last_pk = 0
+        # Порции по первичному ключу: память не растёт с размером таблицы
+        while True:
+            rows = list(
+                model.objects.using(using).filter(pk__gt=last_pk).order_by(
+                    'pk'
+                ).values_list('pk', 'text')[:chunk_size]
+            )
+            if not rows:
+                return total
+            with transaction.atomic(using), connection.cursor() as cursor:
+                cursor.executemany(
+                    f'INSERT INTO {table} (rowid, text) VALUES (%s, %s)',
+                    rows,
+                )
+            total += len(rows)
+            last_pk = rows[-1][0]
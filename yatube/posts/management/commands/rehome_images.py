@@ -0,0 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from core.cache import bump_versions
+from posts import versions
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит картинки постов, сохранённые до хранилища по '
+        'содержимому, в каталоги по хешу. Одинаковые файлы остаются в '
+        'одном экземпляре. Файлы читаются и пишутся в несколько потоков.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument(
+            '--keep-originals', action='store_true',
+            help='Не удалять файлы со старыми именами.',
+        )
+
+    def handle(self, *args, **options):
+        storage = Post._meta.get_field('image').storage
+        names = (
+            name for name in Post.objects.exclude(image='').values_list(
+                'image', flat=True
+            ).distinct().iterator()
+            if not storage.is_hashed(name)
+        )
+        moved = failed = 0
+        authors, groups = set(), set()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            for old, new in pool.map(
+                lambda name: self.copy(storage, name), names
+            ):
+                if new is None:
+                    failed += 1
+                    continue
+                posts = Post.objects.filter(image=old)
+                for author_id, group_id in posts.values_list(
+                    'author_id', 'group_id'
+                ):
+                    authors.add(author_id)
+                    groups.add(group_id)
+                # update() не шлёт сигналов: ссылки учитываем сами
+                with transaction.atomic():
+                    storage.acquire(new, posts.update(image=new))
+                # До acquire() файл могли удалить вместе с последней
+                # чужой ссылкой на то же содержимое
+                if not storage.exists(new):
+                    if self.copy(storage, old)[1] is None:
+                        failed += 1
+                        continue
+                if not options['keep_originals']:
+                    storage.delete(old)
+                moved += 1
+        groups.discard(None)
+        bump_versions(
+            versions.ALL_POSTS,
+            *map(versions.author_feed, authors),
+            *map(versions.group_feed, groups),
+        )
+        self.stdout.write(self.style.SUCCESS(f'Перенесено файлов: {moved}'))
+        if failed:
+            self.stdout.write(self.style.WARNING(
+                f'Не удалось перенести: {failed}'
+            ))
+
+    def copy(self, storage, name):
+        """Копирует файл под имя по содержимому: (старое, новое имя).
+
+        Ссылки на новый файл берёт основной поток, поэтому сохраняется
+        он мимо storage.save().
+        """
+        try:
+            with storage.open(name) as file:
+                new = storage.hashed_name(name, file)
+                storage.store(new, file)
+                return name, new
+        except Exception as error:
+            self.stderr.write(f'{name}: {error}')
+            return name, None
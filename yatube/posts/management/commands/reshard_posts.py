@@ -0,0 +1,182 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from posts import fulltext, sharding
+from posts.models import AuthorShard, Comment, FeedEntry, Group, Post, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Переносит посты авторов вместе с комментариями, записями лент и '
+        'поисковым индексом между шардами. Работает в два шага. Сначала '
+        'команда с новым списком шардов копирует на них пользователей и '
+        'группы и закрепляет в AuthorShard на старом месте авторов, '
+        'которые должны переехать; после этого POST_SHARDS меняют на '
+        'новый список. Затем команда без аргументов переносит '
+        'закреплённых авторов: копирует строки, переключает справочник, '
+        'ждёт SHARD_DIRECTORY_TTL, докопирует записанное за это время и '
+        'удаляет строки со старого шарда.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'shards', nargs='*',
+            help='Новый список шардов; без него — перенос по POST_SHARDS.',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        target = options['shards'] or sharding.shards()
+        unknown = set(target) - settings.DATABASES.keys()
+        if unknown:
+            raise CommandError(f'Нет таких баз: {", ".join(sorted(unknown))}')
+        self.copy_shared(target)
+        if target != sharding.shards():
+            pinned = self.pin(target)
+            self.stdout.write(
+                f'Закреплено авторов: {pinned}. Теперь поменяйте '
+                f'POST_SHARDS на {target} и запустите команду без аргументов.'
+            )
+            return
+        moves = {
+            author_id: (shard, sharding.placement(author_id, target))
+            for author_id, shard in AuthorShard.objects.values_list(
+                'author_id', 'shard'
+            )
+        }
+        moves = {
+            author_id: move for author_id, move in moves.items()
+            if move[0] != move[1]
+        }
+        copied = {
+            author_id: self.copy_author(author_id, *move)
+            for author_id, move in moves.items()
+        }
+        for author_id, (source, shard) in moves.items():
+            AuthorShard.objects.filter(author_id=author_id).update(
+                shard=shard
+            )
+        # Процессы перечитывают справочник не реже раза в TTL; после
+        # этого на старый шард уже никто не пишет
+        if moves:
+            time.sleep(settings.SHARD_DIRECTORY_TTL)
+        for author_id, (source, shard) in moves.items():
+            self.copy_author(author_id, source, shard, *copied[author_id])
+            self.delete_author(author_id, source)
+        # Оставшиеся записи справочника совпадают с хешем и не нужны
+        AuthorShard.objects.filter(author_id__in=[
+            author_id for author_id, shard in AuthorShard.objects.values_list(
+                'author_id', 'shard'
+            )
+            if shard == sharding.placement(author_id, target)
+        ]).delete()
+        sharding.reset_directory()
+        self.stdout.write(self.style.SUCCESS(
+            f'Перенесено авторов: {len(moves)}'
+        ))
+
+    def copy_shared(self, target):
+        """Пользователи и группы, которых ещё нет на шардах."""
+        for alias in target:
+            if alias == DEFAULT_DB_ALIAS:
+                continue
+            for model in (User, Group):
+                self.copy_rows(
+                    model._base_manager.using(DEFAULT_DB_ALIAS), alias
+                )
+
+    def pin(self, target):
+        """Закрепляет в справочнике авторов, которым предстоит переезд."""
+        pins = []
+        for alias in sharding.shards():
+            author_ids = Post.objects.using(alias).order_by().values_list(
+                'author_id', flat=True
+            ).distinct()
+            for author_id in author_ids.iterator():
+                if sharding.placement(author_id, target) != alias:
+                    pins.append(AuthorShard(author_id=author_id, shard=alias))
+        AuthorShard.objects.bulk_create(
+            pins, batch_size=self.batch_size, ignore_conflicts=True
+        )
+        return len(pins)
+
+    def copy_author(self, author_id, source, shard, last_post=0,
+                    last_comment=0):
+        """Копирует строки автора с id больше уже скопированных.
+
+        Возвращает наибольшие скопированные id поста и комментария.
+        """
+        posts = Post._base_manager.using(source).filter(
+            author_id=author_id, pk__gt=last_post
+        )
+        comments = Comment._base_manager.using(source).filter(
+            post__author_id=author_id, pk__gt=last_comment
+        )
+        with transaction.atomic(using=shard):
+            last_post = self.copy_rows(posts, shard) or last_post
+            last_comment = self.copy_rows(comments, shard) or last_comment
+            self.copy_rows(
+                FeedEntry._base_manager.using(source).filter(
+                    author_id=author_id
+                ),
+                shard,
+                keep_pk=False,
+            )
+            for queryset, table in (
+                (posts, fulltext.POSTS_TABLE),
+                (comments, fulltext.COMMENTS_TABLE),
+            ):
+                for pk, text in queryset.values_list('pk', 'text'):
+                    fulltext.index(table, pk, text, shard)
+        return last_post, last_comment
+
+    def copy_rows(self, queryset, alias, keep_pk=True):
+        """Копирует выборку порциями; возвращает наибольший id."""
+        last_pk = 0
+        while True:
+            rows = list(queryset.filter(pk__gt=last_pk).order_by('pk')[
+                :self.batch_size
+            ])
+            if not rows:
+                return last_pk
+            last_pk = rows[-1].pk
+            if not keep_pk:
+                # Записи лент нумеруются на каждом шарде отдельно
+                for row in rows:
+                    row.pk = None
+            queryset.model._base_manager.using(alias).bulk_create(
+                rows, ignore_conflicts=True
+            )
+
+    def delete_author(self, author_id, source):
+        """Удаляет строки автора со старого шарда без сигналов.
+
+        Счётчики, ссылки на картинки и поколения лент при переезде не
+        меняются, поэтому обработчики удаления тут не нужны.
+        """
+        posts = Post._base_manager.using(source).filter(author_id=author_id)
+        post_ids = list(posts.values_list('pk', flat=True))
+        comments = Comment._base_manager.using(source).filter(
+            post__author_id=author_id
+        )
+        with transaction.atomic(using=source):
+            for pk in comments.values_list('pk', flat=True):
+                fulltext.unindex(fulltext.COMMENTS_TABLE, pk, source)
+            for pk in post_ids:
+                fulltext.unindex(fulltext.POSTS_TABLE, pk, source)
+            for queryset in (
+                FeedEntry._base_manager.using(source).filter(
+                    author_id=author_id
+                ),
+                comments,
+                posts,
+            ):
+                queryset._raw_delete(source)
+        cache.delete_many(
+            [sharding.POST_SHARD_KEY.format(pk) for pk in post_ids]
+        )
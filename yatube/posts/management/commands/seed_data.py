@@ -0,0 +1,127 @@
+import random
+from bisect import bisect
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from django.utils import timezone
+from faker import Faker
+from mixer.backend.django import Mixer
+
+from posts import sharding
+from posts.importer import Importer
+from posts.models import Post
+
+User = get_user_model()
+
+# Показатель закона Ципфа: чем больше, тем сильнее перекос к лидерам
+SKEW = 1.1
+# За какой срок распределены даты постов
+HISTORY = timedelta(days=3 * 365)
+
+
+class Zipf:
+    """Случайный номер от 0 до size - 1; номер k выпадает как 1/(k+1)^s."""
+
+    def __init__(self, size, rng, skew=SKEW):
+        self.rng = rng
+        self.weights = list(accumulate(
+            1 / (rank + 1) ** skew for rank in range(size)
+        ))
+
+    def __call__(self):
+        return bisect(self.weights, self.rng.random() * self.weights[-1])
+
+
+class Command(BaseCommand):
+    help = (
+        'Наполняет базу пользователями, группами, постами, комментариями '
+        'и подписками с перекосом как в жизни: немногие авторы пишут '
+        'большую часть постов и собирают большую часть подписчиков. '
+        'С одним и тем же --seed данные получаются одинаковыми.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--groups', type=int, default=10)
+        parser.add_argument('--posts', type=int, default=2000)
+        parser.add_argument('--comments', type=int, default=4000)
+        parser.add_argument('--follows', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if sharding.enabled():
+            # bulk_create пишет в одну базу мимо выдачи id и маршрутизации
+            raise CommandError(
+                'Загрузите данные до включения шардов и разнесите их '
+                'командой reshard_posts'
+            )
+        rng = random.Random(options['seed'])
+        # mixer и Faker берут случайность из модуля random
+        random.seed(options['seed'])
+        fake = Faker('ru_RU')
+        fake.seed_instance(options['seed'])
+        mixer = Mixer(commit=False)
+        mixer.faker.seed_instance(options['seed'])
+
+        prefix = f'seed{options["seed"]}'
+        usernames = [f'{prefix}_{i}' for i in range(options['users'])]
+        User.objects.bulk_create(
+            mixer.cycle(len(usernames)).blend(
+                User, username=iter(usernames), password='!',
+                is_staff=False, is_superuser=False,
+            ),
+            ignore_conflicts=True,
+        )
+        slugs = [f'{prefix}-group-{i}' for i in range(options['groups'])]
+        importer = Importer(
+            batch_size=options['batch_size'], create_missing=True
+        )
+        importer.run(self.records(options, rng, fake, usernames, slugs))
+        importer.finish(stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            'Создано: ' + ', '.join(
+                f'{name} {total}' for name, total in
+                sorted(importer.imported.items())
+            )
+        ))
+
+    @staticmethod
+    def records(options, rng, fake, usernames, slugs):
+        author = Zipf(len(usernames), rng)
+        group = Zipf(len(slugs), rng) if slugs else None
+        start = (Post.objects.aggregate(Max('pk'))['pk__max'] or 0) + 1
+        # Чем новее пост, тем больше у него комментариев
+        post = Zipf(options['posts'], rng)
+        now = timezone.now()
+        step = HISTORY / max(options['posts'], 1)
+        for number in range(options['posts']):
+            yield {
+                'type': 'post',
+                'id': start + number,
+                'author': usernames[author()],
+                'group': slugs[group()] if group and rng.random() < 0.7
+                else None,
+                'text': fake.text(rng.randint(50, 1000)),
+                'pub_date': (
+                    now - HISTORY + step * (number + rng.random())
+                ).isoformat(),
+            }
+        if options['posts']:
+            last = start + options['posts'] - 1
+            for _ in range(options['comments']):
+                yield {
+                    'type': 'comment',
+                    'post': last - post(),
+                    'author': rng.choice(usernames),
+                    'text': fake.sentence(rng.randint(3, 30)),
+                }
+        for _ in range(options['follows']):
+            yield {
+                'type': 'follow',
+                'user': rng.choice(usernames),
+                'author': usernames[author()],
+            }
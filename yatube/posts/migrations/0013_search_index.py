@@ -0,0 +1,38 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table, source in (
+            ('posts_post_fts', 'posts_post'),
+            ('posts_comment_fts', 'posts_comment'),
+        ):
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE {table} '
+                f'USING fts5(text, tokenize="unicode61")'
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (rowid, text) '
+                f'SELECT id, text FROM {source}'
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for table in ('posts_post_fts', 'posts_comment_fts'):
+            cursor.execute(f'DROP TABLE IF EXISTS {table}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0015_image_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorShard',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('shard', models.CharField(max_length=100, verbose_name='Шард')),
+            ],
+            options={
+                'verbose_name': 'Шард автора',
+                'verbose_name_plural': 'Шарды авторов',
+            },
+        ),
+    ]
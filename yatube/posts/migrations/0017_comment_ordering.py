@@ -0,0 +1,17 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:37
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_authorshard'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='comment',
+            options={'ordering': ('-created', '-pk')},
+        ),
+    ]
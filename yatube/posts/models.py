@@ -1,8 +1,15 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
-from django.db.models import F, Q
+from django.core.cache import cache
+from django.db import connections, models, router
+from django.db.models import Count, F, Q
+from django.db.models.sql import InsertQuery
 
+from core.cache import bump_versions_on_commit, get_or_compute
 from core.models import CreatedModel
+from core.storages import ContentAddressedStorage
+
+from . import graph, sharding, versions
 
 User = get_user_model()
 
@@ -16,6 +23,25 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(sharding.ShardedQuerySet):
+    # Колонки, которые выводятся в карточке поста в лентах
+    feed_fields = (
+        'text',
+        'pub_date',
+        'image',
+        'comments_count',
+        'author__username',
+        'author__first_name',
+        'author__last_name',
+        'group__slug',
+        'group__title',
+    )
+
+    def for_feed(self):
+        """Посты с автором и группой одним запросом, без лишних колонок."""
+        return self.select_related('author', 'group').only(*self.feed_fields)
+
+
 class Post(models.Model):
     text = models.TextField(
         verbose_name='Текст поста',
@@ -39,18 +65,97 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    # Заполняются при загрузке через PostForm, см. posts.images.
+    # width_field у ImageField не годится: он открывает файл при каждой
+    # загрузке поста из базы
+    image_width = models.PositiveIntegerField(
+        'Ширина картинки', null=True, blank=True, editable=False,
+    )
+    image_height = models.PositiveIntegerField(
+        'Высота картинки', null=True, blank=True, editable=False,
+    )
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев',
+        default=0,
+        editable=False,
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        # Индексы повторяют фильтр и сортировку каждой ленты
+        indexes = [
+            models.Index(
+                fields=['pub_date', 'id'], name='post_date_idx'),
+            models.Index(
+                fields=['author', 'pub_date', 'id'],
+                name='post_author_date_idx'),
+            models.Index(
+                fields=['group', 'pub_date', 'id'],
+                name='post_group_date_idx'),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
 
+class AuthorStatsManager(models.Manager):
+    def posts_count(self, author):
+        """Число постов автора; при первом обращении счётчик создаётся."""
+        stats = self.filter(author=author).first()
+        if stats is None:
+            stats, _ = self.get_or_create(
+                author=author,
+                defaults={'posts_count': author.posts.count()},
+            )
+        return stats.posts_count
+
+    def change_posts_count(self, author_id, delta):
+        """Сдвигает счётчик постов автора одним UPDATE."""
+        stats = self.filter(author_id=author_id)
+        if delta < 0:
+            stats = stats.filter(posts_count__gte=-delta)
+        updated = stats.update(posts_count=F('posts_count') + delta)
+        # Недостающий счётчик досчитывается при первом же новом посте
+        if not updated and delta > 0:
+            self.bulk_create(
+                [self.model(
+                    author_id=author_id,
+                    posts_count=Post.objects.using(
+                        sharding.shard_for(author_id)
+                    ).filter(author_id=author_id).count(),
+                )],
+                ignore_conflicts=True,
+            )
+
+
+class AuthorStats(models.Model):
+    """Денормализованные счётчики автора."""
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Автор',
+    )
+    posts_count = models.PositiveIntegerField('Число постов', default=0)
+
+    objects = AuthorStatsManager()
+
+    class Meta:
+        verbose_name = 'Статистика автора'
+        verbose_name_plural = 'Статистика авторов'
+
+    def __str__(self):
+        return f'{self.author}: {self.posts_count}'
+
+
 class Comment(CreatedModel):
     post = models.ForeignKey(
         Post,
@@ -66,10 +171,69 @@ class Comment(CreatedModel):
         verbose_name='Текст комментария',
     )
 
+    objects = sharding.ShardedQuerySet.as_manager()
+
+    class Meta:
+        # От новых к старым; порядок идёт по индексу (post, created)
+        ordering = ('-created', '-pk')
+        indexes = [
+            models.Index(
+                fields=['post', 'created'], name='comment_post_created_idx'),
+        ]
+
     def __str__(self):
         return self.text[:15]
 
 
+class FollowManager(models.Manager):
+    """Подписка и отписка одним запросом без гонок.
+
+    get_or_create — это SELECT и INSERT: два параллельных запроса оба не
+    находят подписку, и второй падает на уникальном ключе. Здесь INSERT
+    с пропуском конфликтов и DELETE по условию. Сигналы модели при этом
+    не отправляются, поэтому граф подписок и поколения лент обновляются
+    тут же; записи ленты переносит и убирает вызывающий код.
+    """
+
+    def follow(self, user_id, author_id):
+        """Подписывает; True, если подписки ещё не было."""
+        if user_id == author_id:
+            return False
+        query = InsertQuery(self.model, ignore_conflicts=True)
+        query.insert_values(
+            [self.model._meta.get_field('user'),
+             self.model._meta.get_field('author')],
+            [self.model(user_id=user_id, author_id=author_id)],
+        )
+        using = router.db_for_write(self.model)
+        connection = connections[using]
+        with connection.cursor() as cursor:
+            for sql, params in query.get_compiler(
+                connection=connection
+            ).as_sql():
+                cursor.execute(sql, params)
+            created = cursor.rowcount > 0
+        if created:
+            graph.followed(user_id, author_id)
+            bump_versions_on_commit(
+                *versions.follow_feeds(user_id, author_id), using=using
+            )
+        return created
+
+    def unfollow(self, user_id, author_id):
+        """Отписывает; True, если подписка была."""
+        using = router.db_for_write(self.model)
+        deleted = self.filter(
+            user_id=user_id, author_id=author_id
+        )._raw_delete(using) > 0
+        if deleted:
+            graph.unfollowed(user_id, author_id)
+            bump_versions_on_commit(
+                *versions.follow_feeds(user_id, author_id), using=using
+            )
+        return deleted
+
+
 class Follow(models.Model):
     user = models.ForeignKey(
         User,
@@ -84,6 +248,8 @@ class Follow(models.Model):
         verbose_name='Автор',
     )
 
+    objects = FollowManager()
+
     class Meta:
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
@@ -94,3 +260,207 @@ class Follow(models.Model):
             models.CheckConstraint(
                 check=~Q(author=F('user')), name='self_subscription')
         ]
+
+
+class FeedEntryManager(models.Manager):
+    """Материализованная лента подписок (fan-out-on-write).
+
+    Посты обычных авторов раскладываются по лентам подписчиков при
+    публикации. Посты авторов с огромным числом подписчиков в ленты не
+    пишутся: лента читает их прямо из постов и сливает с записями по
+    дате. Когда такой автор теряет подписчиков до FEED_FANOUT_LIMIT,
+    refill дописывает его посты в ленты.
+    """
+    batch_size = 500
+    pull_cache_key = 'feed:pull_authors'
+
+    def pull_author_ids(self):
+        """Авторы, чьи посты раздаются при чтении, а не при записи."""
+        return get_or_compute(
+            self.pull_cache_key,
+            lambda: set(
+                Follow.objects.values('author').annotate(
+                    followers=Count('pk')
+                ).filter(
+                    followers__gt=settings.FEED_FANOUT_LIMIT
+                ).values_list('author', flat=True)
+            ),
+            settings.FEED_PULL_AUTHORS_TIMEOUT,
+        )
+
+    def _insert(self, entries):
+        batch = []
+        for entry in entries:
+            batch.append(entry)
+            if len(batch) == self.batch_size:
+                self.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        if batch:
+            self.bulk_create(batch, ignore_conflicts=True)
+
+    def fan_out(self, post):
+        """Добавляет новый пост в ленты подписчиков автора."""
+        if post.author_id in self.pull_author_ids():
+            return
+        followers = Follow.objects.filter(
+            author_id=post.author_id
+        ).values_list('user_id', flat=True)
+        # Записи ленты лежат в шарде поста
+        self.db_manager(post._state.db)._insert(
+            self.model(
+                user_id=user_id,
+                author_id=post.author_id,
+                post=post,
+                pub_date=post.pub_date,
+            )
+            for user_id in followers.iterator()
+        )
+
+    @staticmethod
+    def _latest_posts(author_id, since=None):
+        shard = sharding.shard_for(author_id)
+        posts = Post.objects.using(shard).filter(author_id=author_id)
+        if since is not None:
+            posts = posts.filter(pub_date__gt=since)
+        return shard, posts.order_by('-pub_date', '-pk').values_list(
+            'pk', 'pub_date'
+        )[:settings.FEED_BACKFILL_LIMIT]
+
+    def backfill(self, user_id, author_id, since=None):
+        """Переносит в ленту подписчика последние посты автора.
+
+        Постов не больше FEED_BACKFILL_LIMIT: подписка на плодовитого
+        автора не должна вставлять всю его историю, пока ждёт запрос.
+        """
+        shard, posts = self._latest_posts(author_id, since)
+        self.db_manager(shard)._insert(
+            self.model(
+                user_id=user_id,
+                author_id=author_id,
+                post_id=post_id,
+                pub_date=pub_date,
+            )
+            for post_id, pub_date in posts.iterator()
+        )
+
+    def refill(self, author_id):
+        """Возвращает автора к раздаче при записи после отписок.
+
+        Пока автор был в pull_author_ids, его посты в ленты не писались.
+        Когда подписчиков становится не больше FEED_FANOUT_LIMIT, его
+        последние посты дописываются в ленты всех подписчиков.
+        """
+        if author_id not in self.pull_author_ids():
+            return
+        if graph.followers_count(author_id) > settings.FEED_FANOUT_LIMIT:
+            return
+        # Следующие посты автора fan_out разложит сам
+        cache.delete(self.pull_cache_key)
+        shard, posts = self._latest_posts(author_id)
+        posts = list(posts)
+        followers = Follow.objects.filter(
+            author_id=author_id
+        ).values_list('user_id', flat=True)
+        self.db_manager(shard)._insert(
+            self.model(
+                user_id=user_id,
+                author_id=author_id,
+                post_id=post_id,
+                pub_date=pub_date,
+            )
+            for user_id in followers.iterator()
+            for post_id, pub_date in posts
+        )
+
+    def prune(self, user_id, author_id):
+        """Убирает посты автора из ленты бывшего подписчика."""
+        self.db_manager(sharding.shard_for(author_id)).filter(
+            user_id=user_id, author_id=author_id
+        ).delete()
+
+    def for_user(self, user):
+        """Лента подписок пользователя: записи ленты и посты pulled-авторов.
+
+        Возвращает пару выборок, которые FeedPaginator сливает по дате;
+        вторая — None, если таких авторов в подписках нет. Чтение ленты
+        ничего не пишет. При нескольких шардах выборки нужно читать с
+        каждого из них.
+        """
+        pull_author_ids = self.pull_author_ids()
+        pulled = [
+            author_id for author_id in graph.following_ids(user.pk)
+            if author_id in pull_author_ids
+        ]
+        entries = self.filter(user=user).select_related(
+            'post__author', 'post__group'
+        ).only(
+            'pub_date',
+            *(f'post__{field}' for field in PostQuerySet.feed_fields),
+        )
+        if not pulled:
+            return entries, None
+        # Записи, оставшиеся с тех пор, когда автор раздавался при записи,
+        # повторили бы его посты
+        return (
+            entries.exclude(author_id__in=pulled),
+            Post.objects.for_feed().filter(author_id__in=pulled),
+        )
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Читатель',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пост',
+    )
+    pub_date = models.DateTimeField()
+
+    objects = FeedEntryManager()
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_feed_entry'),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'pub_date', 'post'],
+                name='feed_user_date_post_idx'),
+            models.Index(
+                fields=['user', 'author', 'pub_date'],
+                name='feed_user_author_date_idx'),
+        ]
+
+
+class AuthorShard(models.Model):
+    """Шард автора, закреплённый на время переноса reshard_posts."""
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    shard = models.CharField('Шард', max_length=100)
+
+    class Meta:
+        verbose_name = 'Шард автора'
+        verbose_name_plural = 'Шарды авторов'
+
+    def __str__(self):
+        return f'{self.author_id}: {self.shard}'
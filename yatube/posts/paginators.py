@@ -0,0 +1,303 @@
+import base64
+import binascii
+import hashlib
+
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db import connections
+from django.db.models import Max, Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from core.cache import get_or_compute
+
+from . import sharding
+
+COUNT_KEY = 'paginator:count:{}'
+
+
+def encode_cursor(pub_date, pk):
+    """Превращает позицию поста (pub_date, id) в непрозрачный токен."""
+    raw = f'{pub_date.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Возвращает (pub_date, id) из токена или None, если токен битый."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        pub_date, pk = raw.rsplit('|', 1)
+        pub_date = parse_datetime(pub_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+    if pub_date is None:
+        return None
+    return pub_date, pk
+
+
+def estimate_count(queryset):
+    """Оценка числа строк в таблице модели без обхода таблицы."""
+    model = queryset.model
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                [model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] >= 0:
+            return int(row[0])
+    # Ключи растут монотонно: max(id) не меньше числа строк,
+    # а индекс первичного ключа отдаёт его за один шаг
+    manager = model._default_manager.using(queryset.db)
+    return manager.aggregate(Max('pk'))['pk__max'] or 0
+
+
+class CursorPaginator(Paginator):
+    """Keyset-пагинация по (pub_date, id) вместо OFFSET.
+
+    Страница по курсору стоит одного индексного диапазона независимо от
+    глубины и не требует COUNT(*). Обычный page() оставлен для старых
+    ссылок ?page=N; такие страницы тоже получают курсоры, так что дальше
+    навигация идёт уже без OFFSET.
+
+    Для номеров страниц нужно число строк. С count_key оно берётся из
+    кеша: в ключ входит поколение ленты, так что после записи в ленту
+    число пересчитывается. Вместо номеров всех страниц странице даётся
+    окно page_window: крайние страницы и соседние с текущей.
+
+    С shards выборка читается со всех перечисленных шардов и сливается
+    по (pub_date, id); страница ?page=N берёт с каждого шарда N страниц.
+
+    Поле даты позиции задаёт position: у комментариев это created.
+    Равные даты различает tiebreaker.
+    """
+    position = 'pub_date'
+    tiebreaker = 'pk'
+    # Сколько номеров показывать по краям и с каждой стороны от текущего
+    window_ends = 1
+    window_each_side = 2
+
+    def __init__(self, object_list, per_page, count_key=None, shards=None,
+                 **kwargs):
+        super().__init__(
+            object_list.order_by(f'-{self.position}', f'-{self.tiebreaker}'),
+            per_page,
+            **kwargs
+        )
+        self.count_key = count_key
+        self.shards = shards
+
+    @cached_property
+    def count(self):
+        if self.count_key is None:
+            return self.count_rows()
+        # Поколение ленты подписок длинное: по номеру на каждого автора
+        digest = hashlib.md5(self.count_key.encode()).hexdigest()
+        return get_or_compute(
+            COUNT_KEY.format(digest),
+            self.count_rows,
+            timeout=settings.PAGINATOR_COUNT_TIMEOUT,
+        )
+
+    def count_rows(self):
+        if self.shards:
+            return sum(sharding.scatter(
+                lambda alias: self.count_shard(self.object_list.using(alias)),
+                self.shards,
+            ))
+        return self.count_shard(self.object_list)
+
+    @staticmethod
+    def count_shard(queryset):
+        if not queryset.query.where:
+            # Вся большая таблица: хватает оценки, последние страницы
+            # при ней могут оказаться пустыми
+            estimate = estimate_count(queryset)
+            if estimate > settings.PAGINATOR_ESTIMATE_FROM:
+                return estimate
+        return queryset.count()
+
+    def page_window(self, number):
+        """Номера страниц вокруг number; None на месте пропуска."""
+        ends, each_side = self.window_ends, self.window_each_side
+        last = self.num_pages
+        shown = sorted({
+            *range(1, min(ends, last) + 1),
+            *range(max(1, number - each_side),
+                   min(last, number + each_side) + 1),
+            *range(max(1, last - ends + 1), last + 1),
+        })
+        window = []
+        for page in shown:
+            if window and page - window[-1] == 2:
+                # Пропуск в одну страницу короче многоточия
+                window.append(page - 1)
+            elif window and page - window[-1] > 2:
+                window.append(None)
+            window.append(page)
+        return window
+
+    @cached_property
+    def merged(self):
+        """Страница сливается из нескольких выборок, а не режется OFFSET."""
+        return bool(self.shards)
+
+    def filter_after(self, date, pk):
+        """Строки, идущие в ленте после позиции (date, pk)."""
+        field, tiebreaker = self.position, self.tiebreaker
+        # Отдельное условие field__lte даёт базе диапазон по индексу
+        return self.object_list.filter(
+            Q(**{f'{field}__lt': date}) | Q(**{f'{tiebreaker}__lt': pk}),
+            **{f'{field}__lte': date},
+        )
+
+    def filter_before(self, date, pk):
+        """Строки перед позицией, от ближайшей к ней."""
+        field, tiebreaker = self.position, self.tiebreaker
+        return self.object_list.filter(
+            Q(**{f'{field}__gt': date}) | Q(**{f'{tiebreaker}__gt': pk}),
+            **{f'{field}__gte': date},
+        ).order_by(field, tiebreaker)
+
+    def cursor_page(self, after=None, before=None):
+        """Страница постов после курсора after или перед курсором before."""
+        cursor = f'after={after}' if after else f'before={before}'
+        after = decode_cursor(after) if after else None
+        before = decode_cursor(before) if before and not after else None
+        # Лишняя запись говорит о том, что за страницей есть ещё посты
+        rows = self.rows(self.per_page + 1, after, before)
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if before:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, bool(after)
+        if not after and not before:
+            cursor = ''
+        # Номер страницы по курсору неизвестен, кроме самой первой
+        number = None if cursor else 1
+        page = Page(rows, number, self)
+        return self._set_cursors(page, has_next, has_previous, cursor)
+
+    def rows(self, limit, after=None, before=None):
+        """Первые limit строк после позиции after или перед before.
+
+        С шардов строки сливаются по позиции.
+        """
+        queryset = self.object_list
+        if after:
+            queryset = self.filter_after(*after)
+        elif before:
+            queryset = self.filter_before(*before)
+        if not self.shards:
+            return list(queryset[:limit])
+        return sharding.fetch(
+            queryset, limit, key=self.position_of,
+            reverse=not before, aliases=self.shards,
+        )
+
+    def page(self, number):
+        if self.merged:
+            number = self.validate_number(number)
+            bottom = (number - 1) * self.per_page
+            rows = self.rows(bottom + self.per_page)
+            page = Page(rows[bottom:], number, self)
+        else:
+            page = super().page(number)
+        page = self._set_cursors(
+            page,
+            page.has_next(),
+            page.has_previous(),
+            f'page={page.number}',
+        )
+        page.page_window = self.page_window(page.number)
+        return page
+
+    def _set_cursors(self, page, has_next, has_previous, cursor):
+        rows = list(page.object_list)
+        page.object_list = self.objects(rows)
+        page.cursor = cursor
+        page.page_window = []
+        page.next_cursor = page.previous_cursor = ''
+        if rows and has_next:
+            page.next_cursor = encode_cursor(*self.position_of(rows[-1]))
+        if rows and has_previous:
+            page.previous_cursor = encode_cursor(*self.position_of(rows[0]))
+        return page
+
+    def position_of(self, row):
+        return getattr(row, self.position), getattr(row, self.tiebreaker)
+
+    def objects(self, rows):
+        """Объекты, которые попадут на страницу вместо строк выборки."""
+        return rows
+
+
+class CommentPaginator(CursorPaginator):
+    """Комментарии поста от новых к старым."""
+    position = 'created'
+
+
+class FeedPaginator(CursorPaginator):
+    """Пагинация ленты подписок по записям FeedEntry.
+
+    Посты авторов, которых не раскладывают по лентам, приходят в pulled
+    и сливаются с записями ленты по (pub_date, id поста).
+    """
+    tiebreaker = 'post_id'
+
+    def __init__(self, object_list, per_page, pulled=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.pulled = None
+        if pulled is not None:
+            self.pulled = CursorPaginator(
+                pulled, per_page, shards=self.shards
+            )
+
+    @cached_property
+    def merged(self):
+        return super().merged or self.pulled is not None
+
+    def count_rows(self):
+        count = super().count_rows()
+        if self.pulled is not None:
+            count += self.pulled.count_rows()
+        return count
+
+    def rows(self, limit, after=None, before=None):
+        rows = super().rows(limit, after, before)
+        if self.pulled is None:
+            return rows
+        return sharding.merge(
+            [rows, self.pulled.rows(limit, after, before)],
+            key=self.position_of, reverse=not before, limit=limit,
+        )
+
+    def position_of(self, row):
+        # Строки pulled — сами посты
+        if isinstance(row, self.object_list.model):
+            return row.pub_date, row.post_id
+        return row.pub_date, row.pk
+
+    def objects(self, rows):
+        return [
+            row.post if isinstance(row, self.object_list.model) else row
+            for row in rows
+        ]
+
+
+class CountedPaginator(Paginator):
+    """Обычная пагинация с числом строк, известным заранее."""
+
+    def __init__(self, object_list, per_page, count, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self._count = count
+
+    @cached_property
+    def count(self):
+        return self._count
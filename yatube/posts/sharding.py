@@ -0,0 +1,227 @@
+"""Посты, комментарии и записи лент по базам-шардам.
+
+Все посты автора, комментарии к ним и записи лент с этими постами лежат
+в одной базе из settings.POST_SHARDS. База выбирается rendezvous-хешем
+id автора: при добавлении шарда переезжает только доля авторов, которая
+достанется новому шарду. Авторов, которых reshard_posts ещё не
+перенёс, держит на старом месте справочник AuthorShard.
+
+Пользователи и группы хранятся в основной базе и копируются в остальные
+шарды (см. posts.signals): на них ссылаются внешние ключи и JOIN лент.
+Id постов и комментариев при нескольких шардах выдаёт общая
+последовательность, поэтому они не совпадают между базами.
+
+Общие ленты читаются со всех шардов параллельно (scatter) и сливаются
+по дате (merge). С одним шардом всё выполняется в текущем потоке.
+"""
+import hashlib
+import heapq
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, close_old_connections
+from django.db.models import Max, QuerySet
+
+from core.models import Sequence
+
+POST_SHARD_KEY = 'shard:post:{}'
+POST_SHARD_TIMEOUT = 24 * 60 * 60
+
+_executor = None
+_directory = (0, {})
+
+
+def shards():
+    return settings.POST_SHARDS
+
+
+def enabled():
+    return len(shards()) > 1
+
+
+def placement(author_id, aliases):
+    """Шард автора по rendezvous-хешу: у какого шарда вес больше."""
+    return max(aliases, key=lambda alias: hashlib.md5(
+        f'{alias}:{author_id}'.encode()
+    ).digest())
+
+
+def directory():
+    """Авторы, перенесённые reshard_posts: {id автора: шард}."""
+    global _directory
+    expires, authors = _directory
+    if expires < time.monotonic():
+        from .models import AuthorShard
+
+        authors = dict(AuthorShard.objects.values_list('author_id', 'shard'))
+        _directory = (
+            time.monotonic() + settings.SHARD_DIRECTORY_TTL, authors
+        )
+    return authors
+
+
+def reset_directory():
+    global _directory
+    _directory = (0, {})
+
+
+def shard_for(author_id):
+    if not enabled():
+        return shards()[0]
+    return directory().get(author_id) or placement(author_id, shards())
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.SHARD_WORKERS,
+            thread_name_prefix='shards',
+        )
+    return _executor
+
+
+def _call(function, alias):
+    try:
+        return function(alias)
+    finally:
+        close_old_connections()
+
+
+def scatter(function, aliases=None):
+    """Результаты function(шард) по всем шардам, в порядке шардов."""
+    aliases = shards() if aliases is None else aliases
+    if len(aliases) == 1 or not settings.SHARD_WORKERS:
+        return [function(alias) for alias in aliases]
+    return list(_get_executor().map(
+        lambda alias: _call(function, alias), aliases
+    ))
+
+
+def merge(results, key, reverse=False, limit=None):
+    """Слияние уже отсортированных списков с разных шардов."""
+    if len(results) == 1:
+        merged = iter(results[0])
+    else:
+        merged = heapq.merge(*results, key=key, reverse=reverse)
+    return list(islice(merged, limit))
+
+
+def fetch(queryset, limit, key, reverse=True, aliases=None):
+    """Первые limit строк выборки со всех шардов в порядке key."""
+    return merge(
+        scatter(lambda alias: list(queryset.using(alias)[:limit]), aliases),
+        key, reverse, limit,
+    )
+
+
+def next_id(model):
+    """Id новой записи, общий для всех шардов."""
+    return Sequence.objects.next_value(
+        model._meta.label_lower,
+        start=lambda: max(filter(None, scatter(
+            lambda alias: model._base_manager.using(alias).aggregate(
+                last=Max('pk')
+            )['last']
+        )), default=0),
+    )
+
+
+def replicate(instance, aliases=None):
+    """Копирует запись основной базы в шарды, минуя сигналы."""
+    model = type(instance)
+    values = {
+        field.attname: getattr(instance, field.attname)
+        for field in model._meta.concrete_fields
+    }
+    for alias in aliases or shards():
+        if alias == DEFAULT_DB_ALIAS:
+            continue
+        manager = model._base_manager.using(alias)
+        if not manager.filter(pk=instance.pk).update(**values):
+            manager.bulk_create([model(**values)])
+
+
+def locate_post(post_id):
+    """Шард поста по его id или None, если поста нет."""
+    from .models import Post
+
+    if not enabled():
+        return shards()[0]
+    key = POST_SHARD_KEY.format(post_id)
+    alias = cache.get(key)
+    if alias is None:
+        found = scatter(lambda alias: Post.objects.using(alias).filter(
+            pk=post_id
+        ).values_list('author_id', flat=True).first())
+        for alias, author_id in zip(shards(), found):
+            if author_id is not None:
+                cache.set(key, alias, POST_SHARD_TIMEOUT)
+                break
+        else:
+            return None
+    return alias
+
+
+def on_post_shard(queryset, post_id):
+    """Выборка на шарде поста post_id; с одним шардом — как есть."""
+    if not enabled():
+        return queryset
+    alias = locate_post(post_id)
+    return queryset.none() if alias is None else queryset.using(alias)
+
+
+def owner_id(instance):
+    """Автор, по которому шардируется запись, или None."""
+    if instance._meta.model_name == 'comment':
+        post_field = instance._meta.get_field('post')
+        if not post_field.is_cached(instance):
+            return None
+        instance = instance.post
+    return getattr(instance, 'author_id', None)
+
+
+class ShardedQuerySet(QuerySet):
+    def create(self, **kwargs):
+        # QuerySet.create сохраняет в базу менеджера, выбранную без
+        # экземпляра; запись должна уйти в шард своего автора
+        if self._db is not None or not enabled():
+            return super().create(**kwargs)
+        obj = self.model(**kwargs)
+        obj.save(force_insert=True)
+        return obj
+
+
+class ShardRouter:
+    """Посты, комментарии и записи лент — в шард их автора.
+
+    С одним шардом ничего не решает: запросы уходят дальше по
+    DATABASE_ROUTERS. Запрос без экземпляра в подсказках шард не
+    выбирает; общие ленты явно обходят все шарды через scatter().
+    """
+    sharded = {'posts.post', 'posts.comment', 'posts.feedentry'}
+
+    def db_for_read(self, model, **hints):
+        if not enabled() or model._meta.label_lower not in self.sharded:
+            return None
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        if instance._meta.label_lower == 'auth.user':
+            # author.posts; комментарии и ленты пользователя на всех шардах
+            if model._meta.model_name == 'post':
+                return shard_for(instance.pk)
+            return None
+        if instance._meta.label_lower not in self.sharded:
+            return None
+        # База новой записи могла прийти от связанного объекта, например
+        # от пользователя, поэтому для неё шард выбирается заново
+        if instance._state.db and not instance._state.adding:
+            return instance._state.db
+        author_id = owner_id(instance)
+        return None if author_id is None else shard_for(author_id)
+
+    db_for_write = db_for_read
@@ -0,0 +1,165 @@
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.cache import bump_versions_on_commit
+
+from . import fulltext, graph, sharding, versions
+from .models import (AuthorStats, Comment, FeedEntry, Follow, Group, Post,
+                     User)
+
+
+@receiver(pre_save, sender=Post)
+@receiver(pre_save, sender=Comment)
+def assign_shared_id(sender, instance, **kwargs):
+    # Автоинкремент у каждого шарда свой, и id совпадали бы
+    if instance.pk is None and sharding.enabled():
+        instance.pk = sharding.next_id(sender)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Group)
+def replicate_to_shards(sender, instance, using, raw, **kwargs):
+    if using == DEFAULT_DB_ALIAS and not raw and sharding.enabled():
+        sharding.replicate(instance)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Group)
+def delete_from_shards(sender, instance, using, **kwargs):
+    # Удаление на шарде каскадно удаляет посты и комментарии в нём
+    if using == DEFAULT_DB_ALIAS and sharding.enabled():
+        for alias in sharding.shards():
+            if alias != DEFAULT_DB_ALIAS:
+                sender._base_manager.using(alias).filter(
+                    pk=instance.pk
+                ).delete()
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, **kwargs):
+    """Раскладывает новый пост по лентам подписчиков."""
+    if created:
+        FeedEntry.objects.fan_out(instance)
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, **kwargs):
+    if created:
+        AuthorStats.objects.change_posts_count(instance.author_id, 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    AuthorStats.objects.change_posts_count(instance.author_id, -1)
+
+
+@receiver(post_save, sender=Post)
+def count_image_refs(sender, instance, **kwargs):
+    storage = instance.image.storage
+    old_image = getattr(instance, '_old_image', '')
+    # Ссылку на загруженный в этом save() файл уже взял storage.save()
+    if not getattr(instance, '_image_uploaded', False):
+        if instance.image.name == old_image:
+            return
+        storage.acquire(instance.image.name)
+    storage.release(old_image)
+
+
+@receiver(post_delete, sender=Post)
+def release_image(sender, instance, **kwargs):
+    instance.image.storage.release(instance.image.name)
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, using, **kwargs):
+    if created:
+        Post.objects.using(using).filter(pk=instance.post_id).update(
+            comments_count=F('comments_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, using, **kwargs):
+    Post.objects.using(using).filter(
+        pk=instance.post_id, comments_count__gt=0
+    ).update(comments_count=F('comments_count') - 1)
+
+
+@receiver(pre_save, sender=Post)
+def remember_old_values(sender, instance, using, **kwargs):
+    # При смене группы пост пропадает из ленты старой группы,
+    # при смене картинки со старой снимается ссылка
+    instance._old_group_id = None
+    instance._old_image = ''
+    instance._image_uploaded = not instance.image._committed
+    if instance.pk is not None:
+        instance._old_group_id, instance._old_image = Post.objects.using(
+            using
+        ).filter(pk=instance.pk).values_list(
+            'group_id', 'image'
+        ).first() or (None, '')
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def bump_post_feeds(sender, instance, using, **kwargs):
+    names = versions.post_feeds(instance.author_id, instance.group_id)
+    old_group_id = getattr(instance, '_old_group_id', None)
+    if old_group_id not in (None, instance.group_id):
+        names.append(versions.group_feed(old_group_id))
+    bump_versions_on_commit(*names, using=using)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def bump_comment_feeds(sender, instance, using, **kwargs):
+    # Число комментариев выводится в карточке поста во всех лентах
+    post = Post.objects.using(using).filter(
+        pk=instance.post_id
+    ).values_list('author_id', 'group_id').first()
+    if post is not None:
+        bump_versions_on_commit(*versions.post_feeds(*post), using=using)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def bump_follower_feed(sender, instance, using, **kwargs):
+    bump_versions_on_commit(
+        *versions.follow_feeds(instance.user_id, instance.author_id),
+        using=using,
+    )
+
+
+@receiver(post_save, sender=Follow)
+def add_to_graph(sender, instance, created, **kwargs):
+    if created:
+        graph.followed(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def remove_from_graph(sender, instance, **kwargs):
+    graph.unfollowed(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, using, **kwargs):
+    fulltext.index(fulltext.POSTS_TABLE, instance.pk, instance.text, using)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, using, **kwargs):
+    fulltext.unindex(fulltext.POSTS_TABLE, instance.pk, using)
+
+
+@receiver(post_save, sender=Comment)
+def index_comment(sender, instance, using, **kwargs):
+    fulltext.index(
+        fulltext.COMMENTS_TABLE, instance.pk, instance.text, using
+    )
+
+
+@receiver(post_delete, sender=Comment)
+def unindex_comment(sender, instance, using, **kwargs):
+    fulltext.unindex(fulltext.COMMENTS_TABLE, instance.pk, using)
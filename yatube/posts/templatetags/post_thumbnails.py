@@ -0,0 +1,21 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(post, geometry):
+    """Миниатюра картинки поста, а пока она готовится — оригинал.
+
+    {% post_thumbnail post "960x339" as im %}
+    Опции миниатюры берутся из settings.THUMBNAIL_PRESETS.
+    """
+    if not post.image:
+        return None
+    thumbnail = thumbnails.cached_thumbnail(post.image, geometry)
+    if thumbnail is None:
+        thumbnails.schedule(post)
+        thumbnail = thumbnails.cached_thumbnail(post.image, geometry)
+    return thumbnail or post.image
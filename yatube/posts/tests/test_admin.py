@@ -0,0 +1,118 @@
+from unittest import mock
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..admin import ApproximatePaginator
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class AdminChangelistTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост'
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_rows(self, count):
+        start = User.objects.count()
+        users = [
+            User.objects.create_user(username=f'user{start + i}')
+            for i in range(count)
+        ]
+        Post.objects.bulk_create(
+            Post(author=user, group=self.group, text='Пост')
+            for user in users
+        )
+        Comment.objects.bulk_create(
+            Comment(post=self.post, author=user, text='Комментарий')
+            for user in users
+        )
+        Follow.objects.bulk_create(
+            Follow(user=user, author=self.author) for user in users
+        )
+
+    def changelist_queries(self, name):
+        url = reverse(f'admin:posts_{name}_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelists_do_not_grow_with_rows(self):
+        """Число запросов списка не зависит от числа строк."""
+        for name in ('post', 'comment', 'follow'):
+            with self.subTest(name=name):
+                self.add_rows(3)
+                # Первый запрос заполняет кеш вариантов фильтров
+                self.changelist_queries(name)
+                before = self.changelist_queries(name)
+                self.add_rows(20)
+                self.assertEqual(self.changelist_queries(name), before)
+
+    def test_input_filters(self):
+        self.add_rows(3)
+        url = reverse('admin:posts_follow_changelist')
+        response = self.client.get(url, {'user': 'user3'})
+        self.assertEqual(
+            [follow.user.username
+             for follow in response.context['cl'].result_list],
+            ['user3'],
+        )
+        url = reverse('admin:posts_comment_changelist')
+        response = self.client.get(url, {'post': self.post.pk + 1})
+        self.assertEqual(list(response.context['cl'].result_list), [])
+
+    def test_approximate_count(self):
+        """Большие выборки не считаются через COUNT(*) целиком."""
+        self.add_rows(5)
+        paginator = ApproximatePaginator(Post.objects.all(), 2)
+        paginator.count_limit = 2
+        with CaptureQueriesContext(connection) as queries:
+            self.assertGreaterEqual(paginator.count, Post.objects.count())
+        self.assertNotIn('COUNT', queries[0]['sql'])
+        paginator = ApproximatePaginator(
+            Post.objects.filter(author=self.author), 2
+        )
+        self.assertEqual(paginator.count, 1)
+        self.assertFalse(paginator.capped)
+
+    def test_filtered_count_capped(self):
+        """Подсчёт по фильтру обрывается на count_limit строк."""
+        self.add_rows(5)
+        paginator = ApproximatePaginator(
+            Post.objects.filter(text__startswith='Пост'), 2
+        )
+        paginator.count_limit = 2
+        self.assertEqual(paginator.count, 3)
+        self.assertTrue(paginator.capped)
+
+    def test_pages_past_capped_count(self):
+        """Страница за обрывом подсчёта открывается, строки считаются."""
+        self.add_rows(5)
+        post_admin = admin.site._registry[Post]
+        with mock.patch.object(ApproximatePaginator, 'count_limit', 2), \
+                mock.patch.object(post_admin, 'list_per_page', 1):
+            response = self.client.get(
+                reverse('admin:posts_post_changelist'),
+                {'group__id__exact': self.group.pk, 'p': 5},
+            )
+        self.assertEqual(response.status_code, 200)
+        cl = response.context['cl']
+        self.assertEqual(len(cl.result_list), 1)
+        self.assertEqual(cl.paginator.count, 6)
+        self.assertFalse(cl.paginator.capped)
@@ -0,0 +1,189 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from core.models import StoredFile
+
+from ..models import AuthorStats, Comment, FeedEntry, Follow, Group, Post
+
+User = get_user_model()
+
+
+class ImportPostsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='Группа', slug='group')
+
+    def import_file(self, suffix, content, *args):
+        with tempfile.NamedTemporaryFile(
+            'w', suffix=suffix, delete=False
+        ) as file:
+            file.write(content)
+        self.addCleanup(os.remove, file.name)
+        out = StringIO()
+        call_command('import_posts', file.name, *args, stdout=out)
+        return out.getvalue()
+
+    def test_import_jsonl(self):
+        """Импорт сохраняет даты и пересчитывает производные данные."""
+        records = [
+            {'type': 'follow', 'user': 'reader', 'author': 'author'},
+            {'type': 'post', 'id': 500, 'author': 'author',
+             'group': 'group', 'text': 'Старый пост',
+             'pub_date': '2015-05-01T10:00:00'},
+            {'type': 'comment', 'post': 500, 'author': 'reader',
+             'text': 'Комментарий'},
+            {'type': 'comment', 'post': 999, 'author': 'reader',
+             'text': 'К несуществующему посту'},
+            {'type': 'post', 'author': 'nobody', 'text': 'Без автора'},
+        ]
+        self.import_file(
+            '.jsonl', '\n'.join(json.dumps(record) for record in records),
+            '--batch-size', '2',
+        )
+        post = Post.objects.get(pk=500)
+        self.assertEqual(post.pub_date.year, 2015)
+        self.assertEqual(post.group, self.group)
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(AuthorStats.objects.posts_count(self.author), 1)
+        self.assertTrue(
+            Follow.objects.filter(user=self.reader, author=self.author)
+            .exists()
+        )
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.reader, post=post).exists()
+        )
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertEqual(Post.objects.count(), 1)
+
+    def test_import_skips_unreadable_records(self):
+        """Битая запись пропускается, остальные импортируются."""
+        for suffix, content in (
+            ('.jsonl', b'{"author": "author", "text": "\xff"}\n'
+                       b'{"author": "author", "text": "\xd0\x9f\xd0\xbe"\n'
+                       b'[1]\n'
+                       b'{"author": "author", "text": "Bce"}\n'),
+            ('.csv', b'author,text\n'
+                     b'author,\xff\n'
+                     b'author,Bce\n'),
+        ):
+            with self.subTest(suffix=suffix):
+                with tempfile.NamedTemporaryFile(
+                    'wb', suffix=suffix, delete=False
+                ) as file:
+                    file.write(content)
+                self.addCleanup(os.remove, file.name)
+                out = StringIO()
+                call_command(
+                    'import_posts', file.name, '--no-rebuild', stdout=out
+                )
+                self.assertTrue(Post.objects.filter(text='Bce').exists())
+                skipped = 3 if suffix == '.jsonl' else 1
+                self.assertIn(f'invalid: 0, пропущено {skipped}',
+                              out.getvalue())
+                Post.objects.all().delete()
+
+    def test_import_skips_non_scalar_keys(self):
+        """Список или объект вместо автора или типа пропускается."""
+        records = [
+            {'type': ['post'], 'author': 'author', 'text': 'Тип-список'},
+            {'type': 'post', 'author': ['author'], 'text': 'Автор-список'},
+            {'type': 'post', 'author': {'name': 'author'}, 'text': 'Объект'},
+            {'type': 'post', 'author': 'author', 'group': ['group'],
+             'text': 'Группа-список'},
+            {'type': 'follow', 'user': {'name': 'reader'},
+             'author': 'author'},
+            {'type': 'post', 'author': 'author', 'text': 'Bce'},
+        ]
+        out = self.import_file(
+            '.jsonl', '\n'.join(json.dumps(record) for record in records),
+            '--create-missing', '--no-rebuild',
+        )
+        self.assertEqual(
+            list(Post.objects.values_list('text', flat=True)), ['Bce']
+        )
+        self.assertIn('invalid: 0, пропущено 1', out)
+        self.assertIn('post: 1, пропущено 3', out)
+        self.assertIn('follow: 0, пропущено 1', out)
+
+    def test_import_csv_creates_missing(self):
+        self.import_file(
+            '.csv',
+            'author,group,text\nnewcomer,new-group,Пост из CSV\n',
+            '--create-missing',
+        )
+        post = Post.objects.get(text='Пост из CSV')
+        self.assertEqual(post.author.username, 'newcomer')
+        self.assertEqual(post.group.slug, 'new-group')
+        self.assertFalse(post.author.has_usable_password())
+
+    def test_synthetic_benchmark(self):
+        out = StringIO()
+        call_command(
+            'import_posts', '--synthetic', '50', '--synthetic-authors', '5',
+            stdout=out,
+        )
+        self.assertIn('в секунду', out.getvalue())
+        self.assertEqual(Post.objects.count(), 50)
+        self.assertEqual(Comment.objects.count(), 50)
+        self.assertEqual(Follow.objects.count(), 5)
+
+
+class SeedDataTest(TestCase):
+    def seed(self):
+        call_command(
+            'seed_data', '--users', '30', '--groups', '3', '--posts', '300',
+            '--comments', '300', '--follows', '100', stdout=StringIO(),
+        )
+        return list(Post.objects.order_by('pk').values_list(
+            'author__username', 'group__slug', 'text'
+        ))
+
+    def test_seed_data_is_skewed_and_reproducible(self):
+        posts = self.seed()
+        self.assertEqual(len(posts), 300)
+        top = max(
+            AuthorStats.objects.all(), key=lambda stats: stats.posts_count
+        )
+        # Самый плодовитый автор пишет намного больше среднего
+        self.assertGreater(top.posts_count, 300 / 30 * 3)
+        self.assertEqual(Comment.objects.count(), 300)
+        self.assertTrue(FeedEntry.objects.exists())
+        Post.objects.all().delete()
+        self.assertEqual(self.seed(), posts)
+
+
+class RehomeImagesTest(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+    def test_legacy_files_moved_and_deduplicated(self):
+        """Старые файлы переезжают в каталоги по хешу, дубли сливаются."""
+        legacy = FileSystemStorage()
+        author = User.objects.create_user(username='auth')
+        for name in ('posts/one.gif', 'posts/two.gif'):
+            legacy.save(name, ContentFile(b'GIF89a'))
+            Post.objects.create(author=author, text='Пост', image=name)
+        call_command('rehome_images', '--workers', '2', stdout=StringIO())
+        names = set(Post.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        name = names.pop()
+        self.assertTrue(Post.image.field.storage.is_hashed(name))
+        self.assertTrue(legacy.exists(name))
+        self.assertFalse(legacy.exists('posts/one.gif'))
+        self.assertEqual(StoredFile.objects.get(name=name).refs, 2)
@@ -1,12 +1,15 @@
 import shutil
 import tempfile
+from io import BytesIO
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
+from posts.forms import PostForm
 from posts.models import Group, Post
 
 User = get_user_model()
@@ -79,13 +82,13 @@ class PostFormsTests(TestCase):
         # Проверяем, увеличилось ли число постов
         self.assertEqual(Post.objects.count(), posts_count + 1)
         # Проверяем, что создалась запись с заданными параметрами
-        self.assertTrue(
-            Post.objects.filter(
-                text=form_data['text'],
-                group=self.group.pk,
-                image='posts/small.gif'
-            ).latest('author')
-        )
+        post = Post.objects.filter(
+            text=form_data['text'],
+            group=self.group.pk,
+            image_width=2,
+            image_height=1,
+        ).latest('author')
+        self.assertRegex(post.image.name, r'^posts/.+\.jpg$')
 
     def test_edit_post(self):
         form_data = {
@@ -119,3 +122,58 @@ class PostFormsTests(TestCase):
                 group=self.group.pk,
             ).exists()
         )
+
+
+@override_settings(
+    POST_IMAGE_MAX_SIDE=100, POST_IMAGE_MAX_PIXELS=10 ** 6,
+)
+class ImageNormalizationTests(TestCase):
+    @staticmethod
+    def upload(size, mode='RGB', image_format='PNG', **options):
+        buffer = BytesIO()
+        Image.new(mode, size, 'red').save(buffer, image_format, **options)
+        return SimpleUploadedFile('photo.png', buffer.getvalue())
+
+    def form(self, upload):
+        return PostForm({'text': 'Тестовый пост'}, {'image': upload})
+
+    def test_large_image_resized_and_reencoded(self):
+        """Картинка уменьшается и перекодируется в JPEG без EXIF."""
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera'
+        form = self.form(self.upload(
+            (400, 200), image_format='JPEG', exif=exif.tobytes()
+        ))
+        self.assertTrue(form.is_valid(), form.errors)
+        image = form.cleaned_data['image']
+        self.assertEqual(image.name, 'photo.jpg')
+        self.assertEqual(
+            (form.instance.image_width, form.instance.image_height),
+            (100, 50),
+        )
+        with Image.open(image) as result:
+            self.assertEqual(result.format, 'JPEG')
+            self.assertEqual(result.size, (100, 50))
+            self.assertTrue(result.info.get('progressive'))
+            self.assertNotIn('exif', result.info)
+
+    def test_cleared_image_resets_size(self):
+        """Снятая с поста картинка не оставляет размеров."""
+        post = Post(image='posts/photo.jpg', image_width=100, image_height=50)
+        form = PostForm(
+            {'text': 'Тестовый пост', 'image-clear': 'on'}, instance=post
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertIs(form.cleaned_data['image'], False)
+        self.assertIsNone(form.instance.image_width)
+        self.assertIsNone(form.instance.image_height)
+
+    def test_transparent_image_flattened(self):
+        form = self.form(self.upload((10, 10), mode='RGBA'))
+        self.assertTrue(form.is_valid(), form.errors)
+
+    def test_too_many_pixels_rejected(self):
+        """Картинка больше предела пикселей отклоняется."""
+        form = self.form(self.upload((2000, 1000), mode='1'))
+        self.assertFalse(form.is_valid())
+        self.assertIn('image', form.errors)
@@ -1,7 +1,10 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
 
-from ..models import Group, Post
+from ..models import AuthorStats, Comment, Group, Post
 
 User = get_user_model()
 
@@ -32,3 +35,40 @@ class PostModelTest(TestCase):
         group = PostModelTest.group
         expected_object_group = group.title
         self.assertEqual(expected_object_group, str(group))
+
+
+class CountersTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='auth')
+        self.post = Post.objects.create(author=self.user, text='Тестовый пост')
+
+    def test_counters_follow_writes(self):
+        """Счётчики постов и комментариев меняются вместе с записями."""
+        comment = Comment.objects.create(
+            post=self.post, author=self.user, text='Комментарий'
+        )
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        self.assertEqual(AuthorStats.objects.posts_count(self.user), 1)
+        comment.delete()
+        self.post.delete()
+        self.assertEqual(AuthorStats.objects.posts_count(self.user), 0)
+
+    def test_rebuild_counters(self):
+        """Команда rebuild_counters исправляет разошедшиеся счётчики."""
+        Post.objects.bulk_create(
+            [Post(author=self.user, text='Импорт') for _ in range(3)]
+        )
+        Comment.objects.bulk_create(
+            [Comment(post=self.post, author=self.user, text='Импорт')]
+        )
+        call_command('rebuild_counters', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        self.assertEqual(AuthorStats.objects.posts_count(self.user), 4)
+
+
+class QueryPlansTest(TestCase):
+    def test_feeds_use_indexes(self):
+        """Запросы лент не сканируют таблицы и не сортируют на лету."""
+        call_command('check_query_plans', stdout=StringIO())
@@ -1,17 +1,42 @@
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
 from django import forms
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from posts.models import Comment, Follow, Group, Post
+from core import routers
+from core.cache import VERSION_KEY, get_versions
+from posts import graph, sharding, thumbnails, versions
+from posts.models import (AuthorShard, AuthorStats, Comment, FeedEntry,
+                          Follow, Group, Post)
+from posts.paginators import CursorPaginator
+from posts.templatetags.post_thumbnails import post_thumbnail
 
-from ..views import FILTER
+from ..views import COMMENTS_PAGE, FILTER
 
 User = get_user_model()
 
 
+def run_commit_hooks(using=DEFAULT_DB_ALIAS):
+    """Выполняет отложенные on_commit: в TestCase COMMIT не наступает."""
+    connection = connections[using]
+    hooks, connection.run_on_commit = connection.run_on_commit, []
+    for _, hook in hooks:
+        hook()
+
+
 class PostViewsTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -239,17 +264,73 @@ class PostViewsTests(TestCase):
         response = self.authorized_client.get(reverse('posts:index'))
         # И сохраняю ее
         cache_responce = response.content
-        # Удаляю пост
-        test_post.delete()
-        # Запрашиваю главную страницу
+        # Правка в обход моделей не меняет поколение ленты: страница из кеша
+        Post.objects.filter(pk=test_post.pk).update(text='Другой текст')
         response = self.authorized_client.get(reverse('posts:index'))
-        # Сравниваю
         self.assertEqual(cache_responce, response.content)
-        # Очищаю кеш
-        cache.clear()
+        # Удаляю пост: кеш ленты сбрасывается сразу после COMMIT
+        test_post.delete()
+        run_commit_hooks()
         response = self.authorized_client.get(reverse('posts:index'))
         self.assertNotEqual(cache_responce, response.content)
 
+    def test_fragment_cache_keyed_by_owner(self):
+        """Ленты разных групп и авторов с одним поколением не смешиваются."""
+        other_group = Group.objects.create(
+            title='Другая группа', slug='other_slug', description='-',
+        )
+        Post.objects.create(
+            author=self.user2, group=other_group, text='Пост другой группы',
+        )
+        for name in (
+            versions.group_feed(self.group.pk),
+            versions.group_feed(other_group.pk),
+            versions.author_feed(self.user.pk),
+            versions.author_feed(self.user2.pk),
+        ):
+            cache.set(VERSION_KEY.format(name), 1, None)
+        for first, second in (
+            (reverse('posts:group_list', args=(self.group.slug,)),
+             reverse('posts:group_list', args=(other_group.slug,))),
+            (reverse('posts:profile', args=(self.user.username,)),
+             reverse('posts:profile', args=(self.user2.username,))),
+        ):
+            with self.subTest(address=second):
+                self.client.get(first)
+                response = self.client.get(second)
+                self.assertContains(response, 'Пост другой группы')
+
+    def test_feed_caches_invalidated_on_write(self):
+        """Новый пост и комментарий сразу видны во всех лентах."""
+        addresses = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+        )
+        before = {
+            address: self.client.get(address).content
+            for address in addresses
+        }
+        Comment.objects.create(
+            post=self.post, author=self.user2, text='Ещё комментарий'
+        )
+        run_commit_hooks()
+        for address in addresses:
+            with self.subTest(address=address):
+                content = self.client.get(address).content
+                self.assertNotEqual(before[address], content)
+        Follow.objects.create(user=self.user2, author=self.user)
+        follow_page = self.user_follow.get(
+            reverse('posts:follow_index')
+        ).content
+        Post.objects.create(author=self.user, text='Свежий пост')
+        run_commit_hooks()
+        self.assertIn(
+            'Свежий пост'.encode(),
+            self.user_follow.get(reverse('posts:follow_index')).content,
+        )
+        self.assertNotIn('Свежий пост'.encode(), follow_page)
+
 
 # Paginator ++++++
 class PaginatorViewsTest(TestCase):
@@ -286,3 +367,809 @@ class PaginatorViewsTest(TestCase):
             with self.subTest(address=address):
                 response = self.client.get(address)
                 self.assertEqual(len(response.context[template]), FILTER)
+
+    def test_cursor_pages(self):
+        """Курсоры ведут на следующую и предыдущую страницы."""
+        address = reverse('posts:index')
+        first = self.client.get(address).context['page_obj']
+        self.assertEqual(first.previous_cursor, '')
+        second = self.client.get(
+            address, {'after': first.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(len(second), 15 - FILTER)
+        self.assertEqual(second.next_cursor, '')
+        self.assertFalse(set(first) & set(second))
+        back = self.client.get(
+            address, {'before': second.previous_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(back), list(first))
+
+    def test_page_number_compatibility(self):
+        """Старые ссылки ?page=N продолжают работать."""
+        response = self.client.get(reverse('posts:index'), {'page': 2})
+        page_obj = response.context['page_obj']
+        self.assertEqual(len(page_obj), 15 - FILTER)
+        self.assertNotEqual(page_obj.previous_cursor, '')
+
+    def test_page_count_cached_per_feed_version(self):
+        """Число постов считается один раз до новой записи в ленту."""
+        cache.clear()
+        address = reverse('posts:index')
+        self.client.get(address, {'page': 2})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(address, {'page': 2})
+        self.assertFalse(
+            [q for q in queries if 'COUNT(' in q['sql'].upper()]
+        )
+        Post.objects.create(author=self.user, text='Ещё пост')
+        run_commit_hooks()
+        response = self.client.get(address, {'page': 2})
+        self.assertEqual(response.context['page_obj'].paginator.count, 16)
+
+    def test_page_window(self):
+        """Ссылок на страницы не больше окна, пропуски — многоточием."""
+        paginator = CursorPaginator(Post.objects.all(), 1)
+        self.assertEqual(
+            paginator.page_window(8), [1, None, 6, 7, 8, 9, 10, None, 15]
+        )
+        self.assertEqual(paginator.page_window(1), [1, 2, 3, None, 15])
+        self.assertEqual(
+            paginator.page_window(4), [1, 2, 3, 4, 5, 6, None, 15]
+        )
+        response = self.client.get(reverse('posts:index'), {'page': 1})
+        self.assertEqual(response.context['page_obj'].page_window, [1, 2])
+
+
+class FollowFeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def follow_page_posts(self):
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        """Подписка переносит посты в ленту, отписка их убирает."""
+        post = Post.objects.create(author=self.author, text='Старый пост')
+        self.reader_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.author}
+        ))
+        self.assertEqual(self.follow_page_posts(), [post])
+        self.reader_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': self.author}
+        ))
+        self.assertFalse(FeedEntry.objects.filter(user=self.reader).exists())
+        self.assertEqual(self.follow_page_posts(), [])
+
+    @override_settings(FEED_BACKFILL_LIMIT=1)
+    def test_backfill_limited_to_newest_posts(self):
+        Post.objects.create(author=self.author, text='Старый пост')
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.reader_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': self.author}
+        ))
+        self.assertEqual(self.follow_page_posts(), [post])
+
+    def test_new_post_fanned_out(self):
+        """Новый пост сразу попадает в ленты подписчиков."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.reader, post=post).exists()
+        )
+        self.assertEqual(self.follow_page_posts(), [post])
+
+    @override_settings(FEED_FANOUT_LIMIT=0)
+    def test_popular_author_pulled_on_read(self):
+        """Посты популярных авторов дотягиваются при чтении ленты."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertFalse(FeedEntry.objects.filter(post=post).exists())
+        self.assertEqual(self.follow_page_posts(), [post])
+        # Чтение ленты ничего не пишет
+        self.assertFalse(FeedEntry.objects.filter(post=post).exists())
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_pulled_posts_merged_by_date(self):
+        """Посты pulled-автора встают между записями ленты по дате."""
+        pushed = User.objects.create_user(username='pushed')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.reader, author=pushed)
+        # Посты pushed раскладываются по лентам, посты author — нет
+        Follow.objects.create(user=pushed, author=self.author)
+        posts = [
+            Post.objects.create(
+                author=(self.author, pushed)[i % 2], text=f'Пост {i}'
+            )
+            for i in range(FILTER + 2)
+        ][::-1]
+        self.assertEqual(
+            FeedEntry.objects.filter(user=self.reader).count(),
+            len(posts) // 2,
+        )
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        page = response.context['page_obj']
+        self.assertEqual(list(page), posts[:FILTER])
+        self.assertEqual(page.paginator.count, len(posts))
+        response = self.reader_client.get(
+            reverse('posts:follow_index'), {'after': page.next_cursor}
+        )
+        self.assertEqual(list(response.context['page_obj']), posts[FILTER:])
+        response = self.reader_client.get(
+            reverse('posts:follow_index'), {'page': 2}
+        )
+        self.assertEqual(list(response.context['page_obj']), posts[FILTER:])
+
+    @override_settings(FEED_FANOUT_LIMIT=1)
+    def test_author_back_below_limit_refilled(self):
+        """Посты, вышедшие в pull-режиме, остаются в ленте после отписок."""
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=other, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertFalse(FeedEntry.objects.filter(post=post).exists())
+        other_client = Client()
+        other_client.force_login(other)
+        other_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': self.author}
+        ))
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.reader, post=post).exists()
+        )
+        self.assertNotIn(
+            self.author.pk, FeedEntry.objects.pull_author_ids()
+        )
+        self.assertEqual(self.follow_page_posts(), [post])
+
+
+class FollowGraphTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.readers = [
+            User.objects.create_user(username=f'reader{i}')
+            for i in range(FILTER + 1)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.readers[0])
+
+    def test_follow_updates_cached_graph(self):
+        reader = self.readers[0]
+        self.assertFalse(graph.is_following(reader.pk, self.author.pk))
+        self.assertEqual(graph.followers_count(self.author.pk), 0)
+        self.reader_client.get(reverse(
+            'posts:profile_follow', args=(self.author.username,)
+        ))
+        with self.assertNumQueries(0):
+            self.assertTrue(graph.is_following(reader.pk, self.author.pk))
+            self.assertEqual(graph.followers_count(self.author.pk), 1)
+        self.reader_client.get(reverse(
+            'posts:profile_unfollow', args=(self.author.username,)
+        ))
+        with self.assertNumQueries(0):
+            self.assertFalse(graph.is_following(reader.pk, self.author.pk))
+            self.assertEqual(graph.followers_count(self.author.pk), 0)
+
+    def test_graph_rebuilt_on_miss(self):
+        Follow.objects.create(user=self.readers[0], author=self.author)
+        cache.clear()
+        self.assertEqual(
+            list(graph.following_ids(self.readers[0].pk)), [self.author.pk]
+        )
+        self.assertEqual(graph.followers_count(self.author.pk), 1)
+
+    def test_profile_button_and_counts(self):
+        Follow.objects.create(user=self.readers[0], author=self.author)
+        response = self.reader_client.get(
+            reverse('posts:profile', args=(self.author.username,))
+        )
+        self.assertTrue(response.context['following'])
+        self.assertEqual(response.context['followers_count'], 1)
+        self.assertEqual(response.context['following_count'], 0)
+
+    def test_follower_and_following_pages(self):
+        for reader in self.readers:
+            Follow.objects.create(user=reader, author=self.author)
+        address = reverse(
+            'posts:profile_followers', args=(self.author.username,)
+        )
+        first = self.client.get(address).context['page_obj']
+        last = self.client.get(address, {'page': 2}).context['page_obj']
+        self.assertEqual(first.paginator.count, len(self.readers))
+        self.assertEqual(
+            list(first) + list(last), self.readers[::-1]
+        )
+        response = self.client.get(reverse(
+            'posts:profile_following', args=(self.readers[0].username,)
+        ))
+        self.assertEqual(list(response.context['page_obj']), [self.author])
+
+
+class FollowEndpointTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def setUp(self):
+        cache.clear()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_follow_and_unfollow_are_single_statements(self):
+        self.assertTrue(Follow.objects.follow(self.reader.pk, self.author.pk))
+        # Повтор и отписка от несуществующей подписки — один запрос
+        with self.assertNumQueries(1):
+            self.assertFalse(
+                Follow.objects.follow(self.reader.pk, self.author.pk)
+            )
+        self.assertTrue(
+            Follow.objects.unfollow(self.reader.pk, self.author.pk)
+        )
+        with self.assertNumQueries(1):
+            self.assertFalse(
+                Follow.objects.unfollow(self.reader.pk, self.author.pk)
+            )
+        self.assertFalse(Follow.objects.follow(self.reader.pk, self.reader.pk))
+        self.assertFalse(Follow.objects.exists())
+
+    def test_json_toggle(self):
+        for name, following in (
+            ('posts:profile_follow', True),
+            ('posts:profile_follow', True),
+            ('posts:profile_unfollow', False),
+            ('posts:profile_unfollow', False),
+        ):
+            with self.subTest(name=name):
+                response = self.reader_client.post(
+                    reverse(name, args=(self.author.username,)),
+                    HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+                )
+                self.assertEqual(response.json(), {
+                    'following': following,
+                    'followers_count': int(following),
+                })
+
+    def test_redirect_fallback(self):
+        address = reverse('posts:profile', args=(self.author.username,))
+        for name in ('posts:profile_unfollow', 'posts:profile_follow'):
+            with self.subTest(name=name):
+                response = self.reader_client.post(
+                    reverse(name, args=(self.author.username,))
+                )
+                self.assertRedirects(response, address)
+        self.assertTrue(Follow.objects.filter(
+            user=self.reader, author=self.author
+        ).exists())
+
+
+class CommentThreadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+        for i in range(COMMENTS_PAGE + 5):
+            Comment.objects.create(
+                post=cls.post, author=cls.user, text=f'Комментарий {i}'
+            )
+        cls.comments = list(Comment.objects.filter(post=cls.post))
+
+    def setUp(self):
+        cache.clear()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.user)
+
+    def test_newest_comments_inline(self):
+        self.assertEqual(
+            [comment.created for comment in self.comments],
+            sorted((comment.created for comment in self.comments),
+                   reverse=True),
+        )
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,))
+        )
+        self.assertEqual(
+            list(response.context['comments']),
+            self.comments[:COMMENTS_PAGE],
+        )
+        self.assertTrue(response.context['comments_page'].next_cursor)
+
+    def test_fragment_returns_next_batch(self):
+        address = reverse('posts:post_comments', args=(self.post.pk,))
+        cursor = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,))
+        ).context['comments_page'].next_cursor
+        response = self.client.get(address, {'after': cursor})
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertEqual(
+            list(response.context['comments']),
+            self.comments[COMMENTS_PAGE:],
+        )
+        # Accept представление не меняет: адрес у JSON свой
+        response = self.client.get(
+            address, {'after': cursor}, HTTP_ACCEPT='application/json'
+        )
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        data = self.client.get(
+            address, {'after': cursor, 'format': 'json'}
+        ).json()
+        self.assertEqual(
+            [comment['id'] for comment in data['comments']],
+            [comment.pk for comment in self.comments[COMMENTS_PAGE:]],
+        )
+        self.assertEqual(data['next_cursor'], '')
+
+    def test_add_comment_returns_fragment(self):
+        address = reverse('posts:add_comment', args=(self.post.pk,))
+        response = self.authorized_client.post(
+            address, {'text': 'Новый комментарий'},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTemplateUsed(response, 'posts/includes/comment.html')
+        self.assertContains(response, 'Новый комментарий', status_code=201)
+        response = self.authorized_client.post(
+            address, {'text': ''}, HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('text', response.json()['errors'])
+
+
+class FeedQueriesTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='User1')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.user, group=cls.group, text='Тестовый пост'
+        )
+        for i in range(FILTER):
+            author = User.objects.create_user(username=f'author{i}')
+            Post.objects.create(
+                author=author, group=cls.group, text=f'Тестовый пост {i}'
+            )
+            Comment.objects.create(
+                post=cls.post, author=author, text='Комментарий'
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_feed_queries_do_not_grow_with_rows(self):
+        """Число запросов ленты не зависит от числа постов на странице."""
+        # Включая запросы валидаторов условного GET; профиль на пустом
+        # кеше ещё собирает граф подписок автора
+        pages = {
+            reverse('posts:index'): 1,
+            reverse('posts:group_list', kwargs={'slug': 'test_slug'}): 3,
+            reverse('posts:profile', kwargs={'username': 'User1'}): 6,
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}): 4,
+        }
+        for address, queries in pages.items():
+            with self.subTest(address=address):
+                with self.assertNumQueries(queries):
+                    self.client.get(address)
+
+
+@override_settings(THUMBNAIL_WORKERS=1)
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp(dir=settings.BASE_DIR)
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.post = Post.objects.create(
+            author=User.objects.create_user(username='auth'),
+            text='Тестовый пост',
+            image=SimpleUploadedFile(
+                'small.gif',
+                b'GIF89a\x01\x00\x01\x00\x80\x00\x00\x00\x00\x00'
+                b'\xff\xff\xff!\xf9\x04\x00\x00\x00\x00\x00,\x00'
+                b'\x00\x00\x00\x01\x00\x01\x00\x00\x02\x02D\x01\x00;',
+                content_type='image/gif',
+            ),
+        )
+
+    def test_original_served_until_thumbnail_ready(self):
+        """Пока миниатюра в очереди, шаблон получает оригинал."""
+        with mock.patch.object(thumbnails, '_get_executor') as executor:
+            self.assertEqual(
+                post_thumbnail(self.post, '960x339'), self.post.image
+            )
+            post_thumbnail(self.post, '960x339')
+        # Повторный показ не ставит задачу второй раз
+        executor.return_value.submit.assert_called_once()
+        thumbnails.generate(self.post.image.name)
+        thumbnail = post_thumbnail(self.post, '960x339')
+        self.assertNotEqual(thumbnail, self.post.image)
+        self.assertEqual((thumbnail.width, thumbnail.height), (960, 339))
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Тестовый пост')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_not_modified_for_anonymous(self):
+        """Аноним получает 304, пока на странице ничего не изменилось."""
+        addresses = (
+            reverse('posts:index'),
+            reverse('posts:profile', kwargs={'username': self.user}),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+        etags = {}
+        for address in addresses:
+            with self.subTest(address=address):
+                response = self.client.get(address)
+                self.assertIn('public', response['Cache-Control'])
+                self.assertIn('Cookie', response['Vary'])
+                # Дата свежего поста не меняется при комментариях
+                self.assertFalse(response.has_header('Last-Modified'))
+                etags[address] = etag = response['ETag']
+                response = self.client.get(address, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                # Шаблон не отрисовывался
+                self.assertIsNone(response.context)
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Комментарий'
+        )
+        run_commit_hooks()
+        for address in addresses:
+            with self.subTest(address=address):
+                response = self.client.get(
+                    address, HTTP_IF_NONE_MATCH=etags[address]
+                )
+                self.assertEqual(response.status_code, 200)
+
+    def test_versions_bumped_after_commit(self):
+        """До COMMIT читатель не должен кешировать под новым поколением."""
+        before = get_versions(versions.ALL_POSTS)
+        Post.objects.create(author=self.user, text='Новый пост')
+        self.assertEqual(get_versions(versions.ALL_POSTS), before)
+        run_commit_hooks()
+        self.assertNotEqual(get_versions(versions.ALL_POSTS), before)
+
+    def test_authorized_response_is_private(self):
+        client = Client()
+        client.force_login(self.user)
+        response = client.get(reverse('posts:index'))
+        self.assertNotIn('ETag', response)
+        self.assertIn('private', response['Cache-Control'])
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.posts = [
+            Post.objects.create(author=cls.user, text=f'Котики {i}')
+            for i in range(FILTER + 2)
+        ]
+        cls.other = Post.objects.create(author=cls.user, text='Собаки')
+
+    def search(self, **params):
+        return self.client.get(reverse('posts:search'), params).context
+
+    def test_search_pages(self):
+        """Поиск находит посты по префиксу слова и листается курсором."""
+        first = self.search(q='кот')
+        self.assertEqual(len(first['posts']), FILTER)
+        self.assertNotIn(self.other, first['posts'])
+        second = self.search(q='кот', after=first['next_cursor'])
+        self.assertEqual(len(second['posts']), 2)
+        self.assertEqual(second['next_cursor'], '')
+        self.assertEqual(
+            set(first['posts']) | set(second['posts']), set(self.posts)
+        )
+
+    def test_index_follows_writes(self):
+        post = Post.objects.get(pk=self.posts[0].pk)
+        post.text = 'Попугаи'
+        post.save()
+        self.assertEqual(self.search(q='попугаи')['posts'], [post])
+        post.delete()
+        self.assertEqual(self.search(q='попугаи')['posts'], [])
+
+    def test_rebuild_search_index(self):
+        Post.objects.filter(pk=self.other.pk).update(text='Хомяки')
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search(q='хомяки')['posts'], [self.other])
+        self.assertEqual(self.search(q='собаки')['posts'], [])
+
+    def test_admin_uses_search_index(self):
+        admin = User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'
+        )
+        self.client.force_login(admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'соб'}
+        )
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.other]
+        )
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='auth')
+        self.group = Group.objects.create(
+            title='Тестовая группа', slug='test_slug', description='-',
+        )
+        self.post = Post.objects.create(
+            author=self.user, group=self.group, text='Тестовый пост',
+        )
+        self.client.force_login(self.user)
+
+    def get(self, address, **params):
+        """Ответ и число запросов к основной базе и к реплике."""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            response = self.client.get(address, params)
+        self.assertEqual(response.status_code, 200)
+        return response, len(primary), len(replica)
+
+    def test_feed_and_detail_reads_go_to_replica(self):
+        addresses = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.user.username,)),
+            reverse('posts:post_detail', args=(self.post.pk,)),
+            reverse('posts:follow_index'),
+            reverse('posts:search'),
+        )
+        # Граф подписок собирается из основной базы
+        graph.following_ids(self.user.pk)
+        graph.followers_count(self.user.pk)
+        for address in addresses:
+            with self.subTest(address=address):
+                response, primary, replica = self.get(address, q='пост')
+                self.assertEqual(primary, 0)
+                self.assertGreater(replica, 0)
+                self.assertNotIn(routers.STICKY_COOKIE, response.cookies)
+
+    def test_reads_stick_to_primary_after_write(self):
+        """После комментария автор читает из основной базы."""
+        response = self.client.post(
+            reverse('posts:add_comment', args=(self.post.pk,)),
+            {'text': 'Комментарий'},
+        )
+        self.assertIn(routers.STICKY_COOKIE, response.cookies)
+        _, primary, replica = self.get(
+            reverse('posts:post_detail', args=(self.post.pk,))
+        )
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_reads_outside_requests_use_primary(self):
+        self.assertEqual(Post.objects.all().db, 'default')
+
+    def test_replica_refresh_changes_cache_keys(self):
+        """Кеш и ETag, собранные со старого снимка реплики, не находятся."""
+        address = reverse('posts:index')
+        self.client.logout()
+        with mock.patch.object(routers, 'generation', return_value='1'):
+            etag = self.client.get(address)['ETag']
+            response = self.client.get(address, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+        with mock.patch.object(routers, 'generation', return_value='2'):
+            response = self.client.get(address, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+        # Вне запросов читается основная база, метки нет
+        self.assertNotIn('@', get_versions(versions.ALL_POSTS))
+
+    def test_graph_rebuilt_from_primary(self):
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.get(reverse('posts:profile', args=(self.user.username,)))
+        self.assertNotIn(
+            'posts_follow', ' '.join(query['sql'] for query in replica)
+        )
+
+
+@override_settings(POST_SHARDS=['default', 'shard1'], SHARD_DIRECTORY_TTL=0)
+class ShardingTests(TransactionTestCase):
+    databases = {'default', 'shard1'}
+
+    def setUp(self):
+        cache.clear()
+        sharding.reset_directory()
+        # Поисковые индексы не очищаются между тестами вместе с таблицами
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.group = Group.objects.create(
+            title='Тестовая группа', slug='test_slug', description='-',
+        )
+        # По автору на каждый шард
+        self.authors = {}
+        while len(self.authors) < 2:
+            user = User.objects.create_user(
+                username=f'user{User.objects.count()}'
+            )
+            self.authors.setdefault(
+                sharding.placement(user.pk, sharding.shards()), user
+            )
+        self.reader = User.objects.create_user(username='reader')
+        for author in self.authors.values():
+            Follow.objects.create(user=self.reader, author=author)
+        self.posts = [
+            Post.objects.create(
+                author=author, group=self.group, text=f'Пост {i}',
+            )
+            for i in range(3)
+            for author in self.authors.values()
+        ]
+        self.client.force_login(self.reader)
+
+    def newest_first(self, posts):
+        return sorted(posts, key=lambda post: (post.pub_date, post.pk),
+                      reverse=True)
+
+    def test_posts_and_comments_stay_on_author_shard(self):
+        self.assertEqual(
+            len({post.pk for post in self.posts}), len(self.posts)
+        )
+        for shard, author in self.authors.items():
+            with self.subTest(shard=shard):
+                self.assertTrue(
+                    User.objects.using(shard).filter(pk=author.pk).exists()
+                )
+                self.assertEqual(
+                    set(Post.objects.using(shard).values_list(
+                        'author_id', flat=True
+                    )),
+                    {author.pk},
+                )
+                self.assertEqual(author.posts.count(), 3)
+                post = author.posts.first()
+                comment = Comment.objects.create(
+                    post=post, author=self.reader, text='Комментарий',
+                )
+                self.assertEqual(comment._state.db, shard)
+                post.refresh_from_db()
+                self.assertEqual(post.comments_count, 1)
+
+    def test_feeds_merge_all_shards(self):
+        expected = self.newest_first(self.posts)
+        for address in (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:follow_index'),
+        ):
+            with self.subTest(address=address):
+                response = self.client.get(address)
+                page = response.context['page_obj']
+                self.assertEqual(list(page.object_list), expected)
+                self.assertEqual(page.paginator.count, len(expected))
+                response = self.client.get(address, {'page': 1})
+                self.assertEqual(
+                    list(response.context['page_obj'].object_list),
+                    expected,
+                )
+
+    def test_cursor_pages_merge_shards(self):
+        expected = self.newest_first(self.posts)
+        paginator = CursorPaginator(
+            Post.objects.all(), 4, shards=sharding.shards()
+        )
+        first = paginator.cursor_page()
+        second = paginator.cursor_page(after=first.next_cursor)
+        self.assertEqual(list(first.object_list), expected[:4])
+        self.assertEqual(list(second.object_list), expected[4:])
+        back = paginator.cursor_page(before=second.previous_cursor)
+        self.assertEqual(list(back.object_list), expected[:4])
+        self.assertEqual(
+            list(paginator.page(2).object_list), expected[4:]
+        )
+
+    def test_post_pages_find_post_shard(self):
+        for post in self.posts[:2]:
+            with self.subTest(post=post.pk):
+                response = self.client.get(
+                    reverse('posts:post_detail', args=(post.pk,))
+                )
+                self.assertEqual(response.context['post_det'], post)
+                self.client.post(
+                    reverse('posts:add_comment', args=(post.pk,)),
+                    {'text': 'Комментарий'},
+                )
+                self.assertTrue(Comment.objects.using(
+                    sharding.locate_post(post.pk)
+                ).filter(post_id=post.pk).exists())
+        response = self.client.get(reverse('posts:search'), {'q': 'пост'})
+        self.assertCountEqual(response.context['posts'], self.posts)
+
+    def test_rebuild_counters_on_every_shard(self):
+        for author in self.authors.values():
+            post = author.posts.first()
+            Comment.objects.using(post._state.db).bulk_create([
+                Comment(post=post, author=self.reader, text='Импорт')
+            ])
+        AuthorStats.objects.all().delete()
+        call_command('rebuild_counters', stdout=StringIO())
+        for author in self.authors.values():
+            with self.subTest(author=author.username):
+                self.assertEqual(author.posts.first().comments_count, 1)
+                self.assertEqual(
+                    AuthorStats.objects.get(author=author).posts_count, 3
+                )
+
+    def test_post_created_on_author_shard(self):
+        for shard, author in self.authors.items():
+            with self.subTest(shard=shard):
+                self.client.force_login(author)
+                self.client.post(
+                    reverse('posts:post_create'), {'text': 'Новый пост'}
+                )
+                self.assertTrue(Post.objects.using(shard).filter(
+                    author=author, text='Новый пост'
+                ).exists())
+
+    def test_reshard_moves_authors_to_new_shard(self):
+        """Посты, записанные на одном шарде, переезжают на новый."""
+        authors = list(self.authors.values())
+        with override_settings(POST_SHARDS=['default']):
+            # Автор, которому по хешу положен новый шард
+            user = self.reader
+            while sharding.placement(user.pk, ['default', 'shard1']) == (
+                'default'
+            ):
+                user = User.objects.create_user(
+                    username=f'late{User.objects.count()}'
+                )
+            post = Post.objects.create(author=user, text='Поздний пост')
+            Comment.objects.create(
+                post=post, author=self.reader, text='Комментарий'
+            )
+            call_command(
+                'reshard_posts', 'default', 'shard1', stdout=StringIO()
+            )
+        self.assertEqual(AuthorShard.objects.get(author=user).shard,
+                         'default')
+        sharding.reset_directory()
+        # Закреплённый автор до переноса читается со старого шарда
+        self.assertEqual(user.posts.get(), post)
+        call_command('reshard_posts', stdout=StringIO())
+        self.assertFalse(AuthorShard.objects.exists())
+        self.assertEqual(Post.objects.using('shard1').get(pk=post.pk), post)
+        self.assertFalse(
+            Post.objects.using('default').filter(pk=post.pk).exists()
+        )
+        self.assertEqual(
+            Comment.objects.using('shard1').filter(post=post).count(), 1
+        )
+        response = self.client.get(reverse('posts:post_detail',
+                                           args=(post.pk,)))
+        self.assertEqual(response.context['post_det'], post)
+        response = self.client.get(reverse('posts:search'), {'q': 'поздний'})
+        self.assertEqual(response.context['posts'], [post])
+        for author in authors:
+            self.assertEqual(author.posts.count(), 3)
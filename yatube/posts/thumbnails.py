@@ -0,0 +1,108 @@
+"""Заблаговременная подготовка миниатюр картинок постов.
+
+Миниатюры из settings.THUMBNAIL_PRESETS готовятся в фоновом пуле потоков
+сразу после сохранения поста. Шаблоны берут готовую миниатюру из
+хранилища ключей sorl, а пока её нет, показывают оригинал.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+
+from core import timing
+from core.cache import bump_versions
+
+from . import versions
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+QUEUED_KEY = 'thumbnails:queued:{}'
+QUEUED_TIMEOUT = 300
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def _options(source, geometry):
+    # Те же опции, что выставит sorl в get_thumbnail(), иначе имя не совпадёт
+    backend = default.backend
+    options = dict(settings.THUMBNAIL_PRESETS.get(geometry, {}))
+    if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(thumbnail_settings, attr)
+        if value != getattr(default_settings, attr):
+            options.setdefault(key, value)
+    return options
+
+
+def cached_thumbnail(image, geometry):
+    """Готовая миниатюра или None; оригинал при этом не читается."""
+    with timing.measure('thumbnail'):
+        source = ImageFile(image)
+        name = default.backend._get_thumbnail_filename(
+            source, geometry, _options(source, geometry)
+        )
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+
+def generate(image_name, feeds=()):
+    """Готовит все миниатюры картинки и сбрасывает кеш её лент."""
+    try:
+        with timing.measure('thumbnail'):
+            # Хранилище поля входит в ключ миниатюры, см. cached_thumbnail()
+            source = ImageFile(image_name, Post.image.field.storage)
+            for geometry, options in settings.THUMBNAIL_PRESETS.items():
+                get_thumbnail(source, geometry, **options)
+    except Exception:
+        logger.exception('Не удалось подготовить миниатюры %s', image_name)
+    finally:
+        cache.delete(QUEUED_KEY.format(image_name))
+    if feeds:
+        bump_versions(*feeds)
+
+
+def _run(image_name, feeds):
+    try:
+        generate(image_name, feeds)
+    finally:
+        close_old_connections()
+
+
+def schedule(post):
+    """Ставит подготовку миниатюр поста в очередь фоновых потоков.
+
+    Без THUMBNAIL_WORKERS миниатюры готовятся сразу, в текущем потоке.
+    """
+    if not post.image:
+        return
+    feeds = versions.post_feeds(post.author_id, post.group_id)
+    if not settings.THUMBNAIL_WORKERS:
+        generate(post.image.name)
+        return
+    # Пока задача в очереди, повторные запросы её не дублируют
+    if cache.add(QUEUED_KEY.format(post.image.name), True, QUEUED_TIMEOUT):
+        _get_executor().submit(_run, post.image.name, feeds)
+
+
+def schedule_on_commit(post):
+    """Подготовка миниатюр после фиксации транзакции с постом."""
+    transaction.on_commit(lambda: schedule(post))
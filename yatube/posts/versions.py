@@ -0,0 +1,36 @@
+"""Имена поколений кеша для лент постов.
+
+Номер поколения меняется при любой записи, которая видна в ленте,
+см. posts.signals.
+"""
+ALL_POSTS = 'posts'
+
+
+def group_feed(group_id):
+    return f'posts:group:{group_id}'
+
+
+def author_feed(author_id):
+    return f'posts:author:{author_id}'
+
+
+def follower_feed(user_id):
+    return f'posts:follower:{user_id}'
+
+
+def author_followers(author_id):
+    """Подписчики автора: их число выводится в профиле."""
+    return f'posts:followers:{author_id}'
+
+
+def follow_feeds(user_id, author_id):
+    """Всё, что меняется при подписке user_id на author_id."""
+    return [follower_feed(user_id), author_followers(author_id)]
+
+
+def post_feeds(author_id, group_id):
+    """Все ленты, в которых виден пост."""
+    names = [ALL_POSTS, author_feed(author_id)]
+    if group_id is not None:
+        names.append(group_feed(group_id))
+    return names
@@ -1,66 +1,141 @@
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 
+from core.cache import get_versions
+from core.decorators import anonymous_condition
+
+from . import conditions, fulltext, graph, sharding, thumbnails, versions
 from .forms import CommentForm, PostForm
-from .models import Comment, Follow, Group, Post, User
+from .models import AuthorStats, FeedEntry, Follow, Group, Post, User
+from .paginators import (CommentPaginator, CountedPaginator, CursorPaginator,
+                         FeedPaginator)
 
 FILTER = 10
+COMMENTS_PAGE = 20
 
 
-def paginator(request, posts):
-    paginator = Paginator(posts, FILTER)
+def paginator(request, posts, paginator_class=CursorPaginator,
+              count_key=None, scatter=True, **kwargs):
+    # Ленты нескольких авторов собираются со всех шардов
+    shards = sharding.shards() if scatter and sharding.enabled() else None
+    paginator = paginator_class(
+        posts, FILTER, count_key=count_key, shards=shards, **kwargs
+    )
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    if after or before:
+        return paginator.cursor_page(after=after, before=before)
+    # Старые ссылки ?page=N продолжают работать через OFFSET
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return page_obj
+    if page_number:
+        return paginator.get_page(page_number)
+    return paginator.cursor_page()
 
 
+@anonymous_condition(etag_func=conditions.index_etag)
 def index(request):
-    posts = Post.objects.order_by('-pub_date')
+    posts = Post.objects.for_feed()
+    feed_version = get_versions(versions.ALL_POSTS)
     context = {
         'posts': posts,
-        'page_obj': paginator(request, posts),
+        'page_obj': paginator(
+            request, posts, count_key=f'index:{feed_version}'
+        ),
+        'feed_version': feed_version,
     }
     return render(request, 'posts/index.html', context)
 
 
+@anonymous_condition(etag_func=conditions.group_etag)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.order_by('-pub_date')
+    posts = group.posts.for_feed()
+    feed_version = get_versions(versions.group_feed(group.pk))
     context = {
         'group': group,
         'posts': posts,
-        'page_obj': paginator(request, posts),
+        'page_obj': paginator(
+            request, posts, count_key=f'group:{group.pk}:{feed_version}'
+        ),
+        'feed_version': feed_version,
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@anonymous_condition(etag_func=conditions.profile_etag)
 def profile(request, username):
     author = get_object_or_404(User, username=username)
-    posts_obj = author.posts.order_by('-pub_date')
-    posts_count = author.posts.count()
-    following = Follow.objects.filter(
-        user=request.user.id,
-        author=author.id
-    ).exists()
+    posts_obj = author.posts.for_feed()
+    posts_count = AuthorStats.objects.posts_count(author)
+    following = graph.is_following(request.user.id, author.id)
+    feed_version = get_versions(versions.author_feed(author.pk))
     context = {
         'author': author,
         'posts_count': posts_count,
-        'page_obj': paginator(request, posts_obj),
-        'following': following
+        'page_obj': paginator(
+            request, posts_obj,
+            count_key=f'profile:{author.pk}:{feed_version}',
+            # author.posts уже читает из шарда автора
+            scatter=False,
+        ),
+        'following': following,
+        'followers_count': graph.followers_count(author.pk),
+        'following_count': graph.following_count(author.pk),
+        'feed_version': feed_version,
     }
     return render(request, 'posts/profile.html', context)
 
 
+def profile_followers(request, username):
+    author = get_object_or_404(User, username=username)
+    users = User.objects.filter(follower__author=author).order_by(
+        '-follower__pk'
+    )
+    page_obj = CountedPaginator(
+        users, FILTER, graph.followers_count(author.pk)
+    ).get_page(request.GET.get('page'))
+    context = {
+        'author': author,
+        'title': 'Подписчики',
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/follow_list.html', context)
+
+
+def profile_following(request, username):
+    author = get_object_or_404(User, username=username)
+    page_obj = Paginator(
+        graph.following_ids(author.pk), FILTER
+    ).get_page(request.GET.get('page'))
+    found = User.objects.in_bulk(page_obj.object_list)
+    page_obj.object_list = [
+        found[pk] for pk in page_obj.object_list if pk in found
+    ]
+    context = {
+        'author': author,
+        'title': 'Подписки',
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/follow_list.html', context)
+
+
+@anonymous_condition(etag_func=conditions.post_detail_etag)
 def post_detail(request, post_id):
-    post_det = get_object_or_404(Post, pk=post_id)
-    posts_count = Post.objects.filter(author__exact=post_det.author).count()
+    post_det = get_object_or_404(
+        sharding.on_post_shard(Post.objects.for_feed(), post_id),
+        pk=post_id,
+    )
+    posts_count = AuthorStats.objects.posts_count(post_det.author)
     post_title = post_det.text[:30]
-    comments = Comment.objects.filter(post_id=post_id)
+    comments_page = _comments_page(request, post_det)
     form = CommentForm(request.POST or None,)
     context = {
         'form': form,
-        'comments': comments,
+        'comments': comments_page.object_list,
+        'comments_page': comments_page,
         'post_det': post_det,
         'posts_count': posts_count,
         'post_title': post_title,
@@ -68,6 +143,70 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+def _comments_page(request, post):
+    """Страница комментариев поста: самые новые или после курсора."""
+    return CommentPaginator(
+        post.comments.select_related('author'), COMMENTS_PAGE
+    ).cursor_page(after=request.GET.get('after'))
+
+
+@anonymous_condition(etag_func=conditions.post_detail_etag)
+def post_comments(request, post_id):
+    """Следующая порция комментариев: HTML-фрагмент или JSON.
+
+    JSON выбирается параметром ?format=json, а не заголовком Accept:
+    у каждого представления свой адрес, а с ним и свой ETag в кеше прокси.
+    """
+    post = get_object_or_404(
+        sharding.on_post_shard(Post.objects.only('pk'), post_id), pk=post_id
+    )
+    comments_page = _comments_page(request, post)
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'comments': [
+                {
+                    'id': comment.pk,
+                    'author': comment.author.username,
+                    'text': comment.text,
+                    'created': comment.created.isoformat(),
+                }
+                for comment in comments_page
+            ],
+            'next_cursor': comments_page.next_cursor,
+        })
+    context = {
+        'post_id': post.pk,
+        'comments': comments_page.object_list,
+        'comments_page': comments_page,
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
+def search(request):
+    query = request.GET.get('q', '')
+    hits = fulltext.search(
+        fulltext.POSTS_TABLE, query, FILTER + 1, request.GET.get('after')
+    )
+    next_cursor = hits[FILTER - 1][1] if len(hits) > FILTER else ''
+    hits = hits[:FILTER]
+    ids = [pk for pk, _ in hits]
+    posts = Post.objects.for_feed()
+    if sharding.enabled():
+        found = {}
+        for shard_found in sharding.scatter(
+            lambda alias: posts.using(alias).in_bulk(ids)
+        ):
+            found.update(shard_found)
+    else:
+        found = posts.in_bulk(ids)
+    context = {
+        'query': query,
+        'posts': [found[pk] for pk, _ in hits if pk in found],
+        'next_cursor': next_cursor,
+    }
+    return render(request, 'posts/search.html', context)
+
+
 @login_required
 def post_create(request):
     template = 'posts/create_post.html'
@@ -79,7 +218,13 @@ def post_create(request):
         if form.is_valid():
             post = form.save(commit=False)
             post.author = request.user
-            post.save()
+            # Пост и счётчики с лентами сохраняются одной транзакцией
+            # на шарде автора
+            with transaction.atomic(
+                using=sharding.shard_for(request.user.pk)
+            ):
+                post.save()
+            thumbnails.schedule_on_commit(post)
             return redirect('posts:profile', post.author.username)
     return render(request, template, {'form': form})
 
@@ -87,11 +232,14 @@ def post_create(request):
 @login_required
 def post_edit(request, post_id):
     template = 'posts/create_post.html'
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        sharding.on_post_shard(Post.objects.all(), post_id), pk=post_id
+    )
     if post.author != request.user:
         return redirect('posts:post_detail', post_id=post_id)
     form = PostForm(
         request.POST or None,
+        files=request.FILES or None,
         instance=post
     )
     is_edit = post
@@ -100,6 +248,7 @@ def post_edit(request, post_id):
             post = form.save(commit=False)
             post.author = request.user
             post.save()
+            thumbnails.schedule_on_commit(post)
             return redirect('posts:post_detail', post_id)
         context = {
             'form': form,
@@ -112,38 +261,75 @@ def post_edit(request, post_id):
 
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        sharding.on_post_shard(Post.objects.all(), post_id), pk=post_id
+    )
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
-        comment.save()
+        with transaction.atomic(using=post._state.db):
+            comment.save()
+        if request.is_ajax():
+            # Странице нужен только новый комментарий, а не она сама
+            return render(
+                request, 'posts/includes/comment.html',
+                {'comment': comment}, status=201,
+            )
+    elif request.is_ajax() and request.method == 'POST':
+        return JsonResponse({'errors': form.errors}, status=400)
     return redirect('posts:post_detail', post_id=post_id)
 
 
 @login_required
 def follow_index(request):
     # информация о текущем пользователе доступна в переменной request.user
-    post_authors = Post.objects.filter(
-        author__following__user=request.user).order_by('-pub_date')
+    entries, pulled = FeedEntry.objects.for_user(request.user)
+    authors = graph.following_ids(request.user.pk)
+    feed_version = get_versions(
+        versions.follower_feed(request.user.pk),
+        *map(versions.author_feed, authors),
+    )
     context = {
-        'page_obj': paginator(request, post_authors),
+        'page_obj': paginator(
+            request, entries, FeedPaginator,
+            count_key=f'follow:{request.user.pk}:{feed_version}',
+            pulled=pulled,
+        ),
+        'feed_version': feed_version,
     }
     return render(request, 'posts/follow.html', context)
 
 
+def _wants_json(request):
+    return request.is_ajax() or 'application/json' in request.META.get(
+        'HTTP_ACCEPT', ''
+    )
+
+
+def _follow_response(request, author):
+    """Состояние кнопки подписки в JSON или, без JS, редирект в профиль."""
+    if request.method == 'POST' and _wants_json(request):
+        return JsonResponse({
+            'following': graph.is_following(request.user.pk, author.pk),
+            'followers_count': graph.followers_count(author.pk),
+        })
+    return redirect('posts:profile', author.username)
+
+
 @login_required
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
-    if author != request.user:
-        Follow.objects.get_or_create(author=author, user=request.user)
-        return redirect('posts:profile', author.username)
-    return redirect('posts:profile', author.username)
+    if Follow.objects.follow(request.user.pk, author.pk):
+        FeedEntry.objects.backfill(request.user.pk, author.pk)
+    return _follow_response(request, author)
 
 
 @login_required
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
-    Follow.objects.get(author=author, user=request.user).delete()
-    return redirect('posts:profile', author.username)
+    if Follow.objects.unfollow(request.user.pk, author.pk):
+        FeedEntry.objects.prune(request.user.pk, author.pk)
+        FeedEntry.objects.refill(author.pk)
+    return _follow_response(request, author)
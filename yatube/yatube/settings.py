@@ -50,6 +50,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.PerformanceMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,12 +63,23 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'yatube.urls'
 
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+# Без DEBUG разобранные шаблоны живут в памяти процесса и разбираются
+# заранее, при запуске; с DEBUG правки шаблонов видны без перезапуска
+TEMPLATE_PRECOMPILE = not DEBUG
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.template_backends.TimedDjangoTemplates',
+        'NAME': 'django',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS if DEBUG else [
+                ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -84,13 +97,62 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# WAL, PRAGMA и BEGIN IMMEDIATE, см. core.db_backends.sqlite3;
+# соединение живёт между запросами до CONN_MAX_AGE секунд
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'core.db_backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            'pragmas': {},
+        },
+    },
+    # Копия основной базы для чтения, её обновляет refresh_replica.
+    # Журнал отката: копия перезаписывается целиком, WAL тут не нужен
+    'replica': {
+        'ENGINE': 'core.db_backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.replica.sqlite3'),
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            'pragmas': {'journal_mode': 'DELETE', 'query_only': 1},
+            'transaction_mode': 'DEFERRED',
+        },
+        'TEST': {'MIRROR': 'default'},
+    },
+    # Шард постов; включается добавлением в POST_SHARDS, данные на него
+    # переносит reshard_posts
+    'shard1': {
+        'ENGINE': 'core.db_backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.shard1.sqlite3'),
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {
+            'pragmas': {},
+        },
+    },
 }
 
+# Чистый кеш на время тестов, см. core.testing
+TEST_RUNNER = 'core.testing.TestRunner'
+
+DATABASE_ROUTERS = [
+    'posts.sharding.ShardRouter',
+    'core.routers.ReplicaRouter',
+]
+# Чтения с реплики включаются списком ['replica'], когда refresh_replica
+# запущен по расписанию
+DATABASE_REPLICAS = []
+# Сколько после записи чтения пользователя идут в основную базу, секунд;
+# должно быть больше периода запуска refresh_replica
+REPLICA_STICKY_SECONDS = 120
+
+# Базы с постами, комментариями и лентами, см. posts.sharding
+POST_SHARDS = ['default']
+# Потоки для параллельного чтения шардов; 0 — читать по очереди
+SHARD_WORKERS = 4
+# Как часто перечитывается справочник перенесённых авторов, секунд
+SHARD_DIRECTORY_TTL = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -141,10 +203,63 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Кеш в файле SQLite общий для всех воркеров хоста
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache_backends.sqlite.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
     }
 }
 
+# Картинки постов при загрузке: наибольшая сторона, предел пикселей
+# исходника (защита от «бомб»), формат и предельный размер файла
+POST_IMAGE_MAX_SIDE = 2048
+POST_IMAGE_MAX_PIXELS = 40 * 10 ** 6
+POST_IMAGE_FORMAT = 'JPEG'
+POST_IMAGE_MAX_BYTES = 512 * 1024
+
+# Миниатюры картинок постов, которые готовятся заранее: размер и опции
+THUMBNAIL_PRESETS = {
+    '960x339': {'crop': 'center', 'upscale': True},
+}
+# Потоки фоновой подготовки миниатюр; 0 — готовить прямо в запросе
+THUMBNAIL_WORKERS = 2
+
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
+
+# Лента подписок: посты авторов, у которых подписчиков больше лимита,
+# не раскладываются по лентам при записи, а дотягиваются при чтении.
+FEED_FANOUT_LIMIT = 1000
+FEED_PULL_AUTHORS_TIMEOUT = 300
+# Сколько последних постов автора попадает в ленту при подписке
+FEED_BACKFILL_LIMIT = 200
+
+# Число постов для номеров страниц ленты: сколько живёт в кеше, секунд,
+# и с какого размера таблицы вместо COUNT(*) берётся оценка
+PAGINATOR_COUNT_TIMEOUT = 3600
+PAGINATOR_ESTIMATE_FROM = 100000
+
+# Сколько живут закешированные варианты фильтров в админке, секунд
+ADMIN_CHOICES_TIMEOUT = 300
+
+# Журнал производительности запросов, см. core.middleware
+PERFORMANCE_LOG_SAMPLE_RATE = 0.01
+PERFORMANCE_SLOW_REQUEST = 0.5
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.middleware': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}